@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Generates a synthetic zen project for the benchmarks
+
+    python benchmarks/generate.py DIR [-n TARGETS] [-m SOURCES] ...
+
+The project has `targets` targets with `sources` sources each,
+compiled by benchmarks/stubcc.py so no toolchain is needed:
+
+- target 0 (`Core`) is a library every other target depends
+  on (fan-in) and the last one (`App`) is an executable that
+  depends on every library (fan-out), the rest depend on up
+  to `deps` random earlier targets
+- every other target lists its sources through a regex entry
+  (with an excluded directory), the others list each file
+- every source includes a header of its own target, the
+  shared `include/common.h` and a header of each dependency
+- `global` has a cached `command` define and `uncached` of
+  the targets get a `command` define that runs every build
+
+The same arguments (and seed) always give the same project.
+"""
+
+import argparse
+import random
+import json
+import sys
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUBCC = os.path.join(ROOT, "benchmarks", "stubcc.py")
+
+# the define `config-edit` bumps, see `bump_revision`
+REVISION = "BENCH_REVISION"
+
+
+def target_name(i, count):
+    if i == 0:
+        return "Core"
+    if i == count - 1:
+        return "App"
+    return f"Lib{i}"
+
+
+def plan_targets(targets, deps, seed):
+    """
+    The name and dependencies of every target
+    """
+    rng = random.Random(seed)
+    plan = []
+    for i in range(targets):
+        name = target_name(i, targets)
+        if i == 0:
+            dependencies = []
+        elif i == targets - 1:
+            dependencies = [target for target, _ in plan]
+        else:
+            earlier = [target for target, _ in plan[1:]]
+            dependencies = ["Core", *rng.sample(earlier, min(len(earlier), rng.randint(0, deps)))]
+        plan.append((name, dependencies))
+    return plan
+
+
+def quote(value):
+    # json strings are valid yaml
+    return json.dumps(value)
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def generate(root, targets=20, sources=20, deps=3, uncached=0, seed=1):
+    """
+    Writes the project into root, returns the names of
+    the targets in the order they're listed
+    """
+    if targets < 2:
+        raise ValueError("a project needs at least 2 targets")
+
+    plan = plan_targets(targets, deps, seed)
+    write(os.path.join(root, "VERSION"), "1.0.0\n")
+    write(os.path.join(root, "include", "common.h"), "#define COMMON 1\n")
+
+    lines = [
+        "project:",
+        "  name: bench",
+        "  version: \"0.1.0\"",
+        "  languages: [CC]",
+        "overrides:",
+        "  compiler:",
+        f"    CC: {quote(STUBCC)}",
+        "  languages: []",
+        "global:",
+        "  flags:",
+        "    - \"-O2\"",
+        "    - kind: include_dir",
+        "      value: include",
+        "    - kind: include_dir",
+        "      value: .",
+        "  defines:",
+        "    - symbol: VERSION",
+        "      command: \"cat VERSION\"",
+        "      strip_whitespace: true",
+        "      as_type: string",
+        "      cache:",
+        "        inputs: [VERSION]",
+        "targets:",
+    ]
+
+    for i, (name, dependencies) in enumerate(plan):
+        directory = name.lower()
+        header = f"{directory}/{directory}.h"
+        write(os.path.join(root, header), f"#define {name.upper()}_VERSION {i}\n")
+
+        files = []
+        for j in range(sources):
+            # regex targets keep some of their sources a level down
+            source = f"{directory}/src/{'nested/' if j % 4 == 3 else ''}s{j}.c"
+            includes = [f"#include \"{header}\"", "#include \"common.h\""]
+            includes += [f"#include \"{dep.lower()}/{dep.lower()}.h\"" for dep in dependencies]
+            body = f"int {name.lower()}_s{j}(void) {{ return {j}; }}\n"
+            if j == 0 and name == "App":
+                body += "int main(void) { return 0; }\n"
+            write(os.path.join(root, source), "\n".join(includes) + "\n" + body)
+            files.append(source)
+
+        regex = i % 2 == 1
+        if regex:
+            # never built, it's excluded
+            write(os.path.join(root, directory, "src", "skip", "broken.c"), "#error excluded\n")
+
+        lines += [
+            f"  - name: {name}",
+            "    language: CC",
+            f"    type: {'executable' if name == 'App' else 'library'}",
+            "    flags: [inherit, \"-fPIC\"]",
+            "    defines:",
+            "      - inherit: true",
+            f"      - symbol: {name.upper()}",
+            f"        value: \"{i}\"",
+        ]
+        if i == targets // 2:
+            lines += [
+                f"      - symbol: {REVISION}",
+                "        value: \"0\"",
+            ]
+        if 0 < i <= uncached:
+            lines += [
+                f"      - symbol: {name.upper()}_STAMP",
+                f"        command: \"echo {i}\"",
+                "        strip_whitespace: true",
+            ]
+        if len(dependencies) > 0:
+            lines.append(f"    dependencies: [{', '.join(dependencies)}]")
+        if regex:
+            lines += [
+                "    sources:",
+                f"      - path: {directory}/src",
+                "        regex: .+\\.c$",
+                "        exclude: [skip]",
+            ]
+        else:
+            lines.append("    sources:")
+            lines += [f"      - {source}" for source in files]
+
+    write(os.path.join(root, "build.zen"), "\n".join(lines) + "\n")
+    return [name for name, _ in plan]
+
+
+def bump_revision(root):
+    """
+    Changes the value of the one `BENCH_REVISION` define,
+    only the target that has it recompiles
+    """
+    path = os.path.join(root, "build.zen")
+    with open(path, "r") as f:
+        lines = f.read().split("\n")
+
+    for i, line in enumerate(lines):
+        if line.strip() == f"- symbol: {REVISION}":
+            value = lines[i + 1]
+            prefix, _, number = value.rpartition(" ")
+            lines[i + 1] = f"{prefix} \"{int(number.strip(chr(34))) + 1}\""
+            break
+
+    with open(path, "w") as f:
+        f.write("\n".join(lines))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic zen project")
+    parser.add_argument("dir", help="Where to write the project")
+    parser.add_argument("-n", "--targets", type=int, default=20,
+                        help="Number of targets (at least 2)")
+    parser.add_argument("-m", "--sources", type=int, default=20,
+                        help="Sources per target")
+    parser.add_argument("-d", "--deps", type=int, default=3,
+                        help="Most dependencies of a target besides Core")
+    parser.add_argument("-u", "--uncached", type=int, default=0,
+                        help="Targets with a `command` define that runs every build")
+    parser.add_argument("--seed", type=int, default=1,
+                        help="Seed for the dependency graph")
+    args = parser.parse_args()
+
+    names = generate(args.dir, args.targets, args.sources, args.deps, args.uncached, args.seed)
+    print(f"Generated {len(names)} targets with {args.sources} sources each in {args.dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Build benchmark on a synthetic project (see generate.py)
+
+Generates a project, then times these scenarios with the
+stub compiler so only zen's own work is measured:
+
+cold - nothing built yet, no state and no config cache
+noop - everything is up to date
+touch - one source of a target in the middle changed
+config - a define of one target in build.zen changed
+
+Each scenario runs `--runs` times and the median is reported
+along with how many compiles and links the last run did.
+`-o` writes the results as JSON, `--compare` an older results
+file (e.g. from another commit) and exits with 1 when a
+scenario got slower by more than the threshold.
+
+    python benchmarks/scale.py -n 50 -m 40 -o before.json
+    git checkout my-branch
+    python benchmarks/scale.py -n 50 -m 40 --compare before.json
+"""
+
+import argparse
+import statistics
+import subprocess
+import platform
+import tempfile
+import shutil
+import json
+import time
+import sys
+import os
+
+from generate import generate, bump_revision, target_name
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ZEN = os.path.join(ROOT, "bin", "zen")
+
+SCENARIOS = ["cold", "noop", "touch", "config"]
+
+
+def run_zen(project, args, log):
+    env = dict(os.environ, PYTHONPATH=ROOT, ZEN_STUB_LOG=log)
+    if os.path.exists(log):
+        os.remove(log)
+
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, ZEN, "-r", *args],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        cwd=project,
+        env=env
+    )
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stdout.decode() + proc.stderr.decode())
+        raise SystemExit(f"zen {' '.join(args)} failed in {project}")
+
+    compiles, links = 0, 0
+    if os.path.exists(log):
+        with open(log) as f:
+            for line in f:
+                if " -c " in f" {line} ":
+                    compiles += 1
+                elif " -o " in line:
+                    links += 1
+    return wall, compiles, links
+
+
+def reset(project):
+    shutil.rmtree(os.path.join(project, "build"), ignore_errors=True)
+    for name in os.listdir(project):
+        if name.startswith(".zenstate") or name == ".zenconfig":
+            os.remove(os.path.join(project, name))
+
+
+def touch_source(project, middle, run):
+    # a new comment changes the contents too, so --hash sees it
+    path = os.path.join(project, middle.lower(), "src", "s0.c")
+    with open(path, "a") as f:
+        f.write(f"// touched {run}\n")
+
+
+def measure(project, scenario, middle, args, runs):
+    log = os.path.join(project, ".stub.log")
+    walls = []
+    compiles, links = 0, 0
+    for run in range(runs):
+        if scenario == "cold":
+            reset(project)
+        elif scenario == "touch":
+            touch_source(project, middle, run)
+        elif scenario == "config":
+            bump_revision(project)
+        wall, compiles, links = run_zen(project, args, log)
+        walls.append(wall)
+
+    return {
+        "median": round(statistics.median(walls), 4),
+        "min": round(min(walls), 4),
+        "runs": [round(wall, 4) for wall in walls],
+        "compiles": compiles,
+        "links": links,
+    }
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout.decode().strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout.strip() != b""
+    except OSError:
+        return None
+    return f"{commit}-dirty" if dirty and commit else commit or None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Zen build benchmark on a synthetic project")
+    parser.add_argument("-n", "--targets", type=int, default=20,
+                        help="Number of targets (at least 3)")
+    parser.add_argument("-m", "--sources", type=int, default=20,
+                        help="Sources per target")
+    parser.add_argument("-d", "--deps", type=int, default=3,
+                        help="Most dependencies of a target besides Core")
+    parser.add_argument("-u", "--uncached", type=int, default=0,
+                        help="Targets with a `command` define that runs every build")
+    parser.add_argument("--seed", type=int, default=1,
+                        help="Seed for the dependency graph")
+    parser.add_argument("-r", "--runs", type=int, default=5,
+                        help="Runs per scenario, the median is reported")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="-j for zen")
+    parser.add_argument("-s", "--scenario", action="append", choices=SCENARIOS, default=None,
+                        help="Only run this scenario (can be given more than once)")
+    parser.add_argument("-o", "--output", default=None, metavar="FILE",
+                        help="Write the results as JSON to FILE")
+    parser.add_argument("--compare", default=None, metavar="FILE",
+                        help="Compare against the results in FILE")
+    parser.add_argument("-t", "--threshold", type=float, default=0.25,
+                        help="Allowed slowdown over --compare (0.25 is 25%%)")
+    parser.add_argument("--keep", default=None, metavar="DIR",
+                        help="Generate the project in DIR and keep it")
+    args = parser.parse_args()
+
+    if args.targets < 3:
+        parser.error("--targets must be at least 3")
+
+    zen_args = [] if args.jobs is None else ["-j", str(args.jobs)]
+    middle = target_name(args.targets // 2, args.targets)
+    scenarios = [name for name in SCENARIOS if args.scenario is None or name in args.scenario]
+
+    project = args.keep if args.keep is not None else tempfile.mkdtemp(prefix="zen-bench-")
+    try:
+        generate(project, args.targets, args.sources, args.deps, args.uncached, args.seed)
+        # every scenario but cold starts from a finished build
+        run_zen(project, zen_args, os.path.join(project, ".stub.log"))
+        results = {name: measure(project, name, middle, zen_args, args.runs) for name in scenarios}
+    finally:
+        if args.keep is None:
+            shutil.rmtree(project, ignore_errors=True)
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "project": {
+            "targets": args.targets,
+            "sources": args.sources,
+            "deps": args.deps,
+            "uncached": args.uncached,
+            "seed": args.seed,
+        },
+        "jobs": args.jobs,
+        "scenarios": results,
+    }
+
+    baseline = {}
+    if args.compare is not None:
+        with open(args.compare) as f:
+            old = json.load(f)
+        if old.get("project") != report["project"]:
+            print(f"Warning: {args.compare} is from a different project, {old.get('project')}")
+        baseline = old.get("scenarios", {})
+
+    failed = False
+    for name, res in results.items():
+        line = f"{name:6} {res['median'] * 1000:8.1f}ms  {res['compiles']:5} compiles {res['links']:4} links"
+        if name in baseline:
+            ratio = res["median"] / baseline[name]["median"]
+            line += f"  {ratio:5.2f}x of {baseline[name]['median'] * 1000:.1f}ms"
+            if ratio > 1 + args.threshold:
+                line += "  SLOWER"
+                failed = True
+        print(line)
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"Results written to {args.output}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark for the `zen` command line
+
+Runs `zen --help` and a no-op build of a small project under
+`python -X importtime`, each run paired with `python -c pass`
+as a reference for how fast this machine is right now. Exits
+with 1 when a scenario imported a module it shouldn't need
+(yaml and cerberus are only for parsing build.zen, and a no-op
+build shouldn't get past the manifest check) or when its
+import time relative to the reference grew by more than the
+threshold over startup_baseline.json.
+
+Wall times are reported but never fail the run, they swing
+too much from one run to the next to gate on.
+
+    python benchmarks/startup.py            # compare
+    python benchmarks/startup.py --update   # record a new baseline
+"""
+
+import argparse
+import statistics
+import subprocess
+import tempfile
+import json
+import time
+import sys
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ZEN = os.path.join(ROOT, "bin", "zen")
+BASELINE = os.path.join(ROOT, "benchmarks", "startup_baseline.json")
+
+BUILD_ZEN = """\
+project:
+  name: startup
+  version: "0.1.0"
+  languages: [CC]
+targets:
+  - name: Hello
+    language: CC
+    sources: [main.c]
+"""
+
+# python starting up and importing nothing of its own
+REFERENCE = ["-c", "pass"]
+
+SCENARIOS = {
+    "help": {
+        "args": ["--help"],
+        "forbidden": ["yaml", "cerberus", "zenbuild.config", "zenbuild.builder"],
+    },
+    "noop": {
+        "args": [],
+        # served from the manifest of the first build
+        "forbidden": ["yaml", "cerberus", "zenbuild.config", "zenbuild.builder"],
+    },
+}
+
+
+def run(args, cwd):
+    """
+    Runs python with args (zen's, or `-c pass` for the
+    reference), returns the wall time, the time spent
+    importing and every module imported
+    """
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        cwd=cwd,
+        env=env
+    )
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stderr.decode())
+        raise SystemExit(f"{' '.join(args)} failed")
+
+    # lines look like "import time:  self [us] | cumulative | name"
+    imports = 0
+    modules = set()
+    for line in proc.stderr.decode().splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        us, _, name = line[len("import time:"):].split("|")
+        imports += int(us)
+        modules.add(name.strip())
+    return wall, imports / 1e6, modules
+
+
+def measure(name, scenario, cwd, runs):
+    walls, imports, ratios, modules = [], [], [], set()
+    for _ in range(runs):
+        wall, imp, mods = run([ZEN, *scenario["args"]], cwd)
+        _, reference, _ = run(REFERENCE, cwd)
+        walls.append(wall)
+        imports.append(imp)
+        # right after each other, so both see the same machine
+        ratios.append(imp / reference)
+        modules |= mods
+    return {
+        "wall": statistics.median(walls),
+        "imports": statistics.median(imports),
+        "ratio": statistics.median(ratios),
+        "forbidden": sorted(m for m in scenario["forbidden"] if m in modules),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Zen startup benchmark")
+    parser.add_argument("-n", "--runs", type=int, default=15,
+                        help="Runs per scenario, the median is reported")
+    parser.add_argument("-t", "--threshold", type=float, default=0.25,
+                        help="Allowed growth of the import time ratio over the baseline (0.25 is 25%%)")
+    parser.add_argument("--update", action="store_true",
+                        help="Write the results as the new baseline")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as project:
+        with open(os.path.join(project, "build.zen"), "w") as f:
+            f.write(BUILD_ZEN)
+        with open(os.path.join(project, "main.c"), "w") as f:
+            f.write("int main(void) { return 0; }\n")
+        # written just now it's too recent for the manifest to trust
+        past = time.time() - 60
+        for name in ("build.zen", "main.c"):
+            os.utime(os.path.join(project, name), (past, past))
+        # the first build compiles and fills the config cache
+        run([ZEN], project)
+
+        results = {name: measure(name, scenario, project, args.runs) for name, scenario in SCENARIOS.items()}
+
+    if args.update:
+        with open(BASELINE, "w") as f:
+            json.dump({name: {"ratio": round(res["ratio"], 2)} for name, res in results.items()}, f, indent=2)
+            f.write("\n")
+        print(f"Baseline written to {os.path.relpath(BASELINE)}")
+        return 0
+
+    baseline = {}
+    if os.path.exists(BASELINE):
+        with open(BASELINE) as f:
+            baseline = json.load(f)
+
+    failed = False
+    for name, res in results.items():
+        base = baseline.get(name, {})
+        line = f"{name:6} wall {res['wall'] * 1000:7.1f}ms  imports {res['imports'] * 1000:7.1f}ms ({res['ratio']:.2f}x python)"
+        if "ratio" in base and res["ratio"] > base["ratio"] * (1 + args.threshold):
+            line += f"  SLOWER imports (baseline {base['ratio']:.2f}x python)"
+            failed = True
+        if len(res["forbidden"]) > 0:
+            line += f"  imported {', '.join(res['forbidden'])}"
+            failed = True
+        print(line)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
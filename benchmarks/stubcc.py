@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+A stand-in C compiler for the benchmarks, fast and with
+no toolchain needed
+
+It understands what zen runs: `-c` (compile), `-E`
+(preprocess), `-x <lang>` (precompiled headers), `-MMD -MF`
+(depfiles), `-shared`/`-o` (link) and `--version` and
+`-dumpmachine` (remote workers). Objects and outputs hold a
+digest of their inputs and flags so they change exactly when
+a real compiler's output would.
+
+`#include "..."` lines are followed through the `-I` dirs so
+the depfiles list the headers a source really uses. Every
+invocation is appended to $ZEN_STUB_LOG when it's set.
+"""
+
+import hashlib
+import sys
+import os
+
+
+def find_include(name, source, include_dirs):
+    for directory in [os.path.dirname(source), *include_dirs]:
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def read_tree(source, include_dirs, seen):
+    """
+    The contents of a source with its includes inlined,
+    each header once
+    """
+    out = []
+    with open(source, "r") as f:
+        for line in f:
+            stripped = line.strip()
+            if stripped.startswith("#include \"") and stripped.endswith("\""):
+                path = find_include(stripped[len("#include \""):-1], source, include_dirs)
+                if path is not None and path not in seen:
+                    seen.append(path)
+                    out.append(read_tree(path, include_dirs, seen))
+                continue
+            out.append(line)
+    return "".join(out)
+
+
+def main(argv):
+    log = os.environ.get("ZEN_STUB_LOG")
+    if log:
+        with open(log, "a") as f:
+            f.write(" ".join(argv) + "\n")
+
+    if "--version" in argv:
+        print("stubcc 1.0")
+        return 0
+    if "-dumpmachine" in argv:
+        print("stub-unknown-none")
+        return 0
+
+    output = None
+    depfile = None
+    include_dirs = []
+    inputs = []
+    flags = []
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        if arg == "-o":
+            output = argv[i + 1]
+            i += 2
+            continue
+        if arg == "-MF":
+            depfile = argv[i + 1]
+            i += 2
+            continue
+        if arg in ("-x", "-include"):
+            flags.extend(argv[i:i + 2])
+            i += 2
+            continue
+        if arg.startswith("-I"):
+            include_dirs.append(arg[2:])
+        if arg.startswith("-"):
+            flags.append(arg)
+        else:
+            inputs.append(arg)
+        i += 1
+
+    digest = hashlib.blake2b(" ".join(flags).encode(), digest_size=16)
+    if "-c" in flags or "-E" in flags or "-x" in flags:
+        if len(inputs) != 1:
+            sys.stderr.write("stubcc: expected exactly one input\n")
+            return 1
+
+        source = inputs[0]
+        headers = []
+        try:
+            text = read_tree(source, include_dirs, headers)
+        except OSError as e:
+            sys.stderr.write(f"stubcc: {e}\n")
+            return 1
+        if "#error" in text:
+            sys.stderr.write(f"{source}: error: #error\n")
+            return 1
+
+        if depfile is not None:
+            target = output if output is not None else "-"
+            with open(depfile, "w") as f:
+                f.write(f"{target}: {' '.join([source, *headers])}\n")
+
+        if "-E" in flags:
+            sys.stdout.write(text)
+            return 0
+        digest.update(text.encode())
+    else:
+        # linking, the output depends on every object
+        for path in inputs:
+            with open(path, "rb") as f:
+                digest.update(f.read())
+
+    if output is not None:
+        with open(output, "w") as f:
+            f.write(digest.hexdigest() + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
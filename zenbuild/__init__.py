@@ -1,17 +1,40 @@
-from .config import Config
-from .verifier import ZenValidator, ZenVerifier, VerificationError
-from .build import build, clean
+from .version import __version__
 
-__all__ = [
+# everything else is imported on first use (PEP 562) so
+# `zen --help` or `zen init` don't pay for yaml, cerberus
+# and the rest of the build machinery
+_LAZY = {
   # .config
-  "Config",
+  "Config": ".config",
 
   # .verifier
-  "ZenValidator",
-  "ZenVerifier",
-  "VerificationError",
-
-  # .build
-  "build",
-  "clean",
-]
+  "ZenValidator": ".verifier",
+  "ZenVerifier": ".verifier",
+  "VerificationError": ".verifier",
+
+  # .builder
+  "build": ".builder",
+  "clean": ".builder",
+
+  # .watcher
+  "watch": ".watcher",
+
+  # .compile_db
+  "compdb": ".compile_db",
+}
+
+__all__ = ["__version__", *_LAZY]
+
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    import importlib
+    value = getattr(importlib.import_module(_LAZY[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return __all__
@@ -0,0 +1,806 @@
+from .provider import LANGUAGE_DEFAULTS
+from .config import Config, BUILD_ROOT
+from .jobs import JobPool, schedule, run_command, default_jobs
+from .plan import get_plan, unit_source, pch_source
+from .manifest import save_manifest, remove_manifest
+from concurrent.futures import as_completed
+import threading
+import shutil
+import time
+import sys
+import os
+import subprocess
+
+_print_lock = threading.Lock()
+_status_len = 0
+
+def zprint(config, *args, **kwargs):
+    global _status_len
+    using_raw = "raw" in kwargs and kwargs["raw"] == True
+    if config.events.enabled:
+        # the event stream is the only output
+        return
+    elif config.raw_mode and not using_raw:
+        return
+    elif not config.raw_mode and using_raw:
+        return
+
+    end = None if "end" not in kwargs else kwargs["end"]
+    with _print_lock:
+        if _status_len > 0:
+            # finish the status line instead of printing over it
+            print()
+            _status_len = 0
+        print(*args, end=end, flush=True)
+
+def zstatus(config, msg):
+    """
+    Rewrites the status line in place, parallel jobs
+    all report their progress through it
+    """
+    global _status_len
+    if config.raw_mode or config.events.enabled:
+        return
+
+    with _print_lock:
+        print(f"\r{msg}{' ' * (_status_len - len(msg))}", end="", flush=True)
+        _status_len = len(msg)
+
+def zerror(msg):
+    """
+    Prints the output of a failed job (in raw mode too)
+    """
+    global _status_len
+    with _print_lock:
+        if _status_len > 0:
+            print()
+            _status_len = 0
+        print(msg, flush=True)
+
+def report(config, target, action, file, proc):
+    """
+    Reports what a job printed, as a diagnostic event with
+    --output=jsonl (warnings of successful jobs too) and
+    otherwise only when the job failed
+    """
+    if config.events.enabled:
+        text = proc.stdout.decode(errors="replace") + proc.stderr.decode(errors="replace")
+        if text != "":
+            config.events.emit("diagnostic", action=action, target=target["name"], file=file, status=proc.returncode, text=text)
+    elif proc.returncode != 0:
+        zerror(proc.stderr.decode())
+
+def artifacts(config):
+    """
+    This is called after the sanity of the config is
+    verified and calculates the required build artifacts
+    that are to be created (both by zen and by the compilation process)
+    
+    Note: artifacts created by Zen and compilation are separate items in
+    a tuple as to allow `config_sanity` to create Zen's requirements
+
+    The data structure for the return value may look like the following:
+    (
+        [(some_zen_artifact, if artifact is dir, True, else, False)],
+        [some_compiler_artifact, another_compiler_artifact]
+    )
+    """
+    plan = get_plan(config)
+    targets = [target for target in plan.targets if target.outfile is not None]
+
+    return (
+        [
+            *[(config.target_dir(target.name), True) for target in targets],
+            (config.state.path, False),
+            (os.path.join(config.config_dir, ".zenconfig"), False),
+            (config.manifest, False)
+        ],
+        [
+            obj for target in targets for obj in target.objects
+        ]
+    )
+
+
+def config_sanity(config, skip_creation=False):
+    """
+    At this point, the config should've been verified
+    but here we'll need to verify the config once more.
+    
+    This isn't a redo of the previous pass but instead
+    a series of checks for verify the validity of the config.
+    
+    This includes checking if files exist, if targets exist,
+    and creating directories for build artifacts (unless
+    skip_creation is set)
+    """
+    plan = get_plan(config)
+
+    # verify flags
+    errs = list(plan.errors)
+    for target in plan.targets:
+        if target.target["type"] == "shell":
+            continue
+
+        if "language" not in target.target:
+            errs.append(f"Non-shell target ({target.name}) requires a language identifier")
+            continue
+
+        # verify that all files exist
+        for file in target.sources:
+            if not os.path.exists(file):
+                errs.append(f"File doesn't exist but is in the Zen config: {file}")
+
+        for file in target.watching:
+            if not os.path.exists(file):
+                errs.append(f"File doesn't exist but is in the Zen config: {file}")
+
+        if "precompiled_header" in target.target and not os.path.exists(target.target["precompiled_header"]):
+            errs.append(f"File doesn't exist but is in the Zen config: {target.target['precompiled_header']}")
+
+    # both are directories under build/, one would clean or
+    # build over the other
+    profiles = config["profiles"] if "profiles" in config.vcfg else {}
+    for target in config["targets"]:
+        if target["name"] in profiles:
+            errs.append(f"Profile ({target['name']}) has the same name as a target")
+
+    # create basic artifacts if needed (not for a config
+    # that's already invalid, they may land on each other)
+    if not skip_creation and len(errs) == 0:
+        zen_artifacts, _ = artifacts(config)
+        for artifact, is_dir in zen_artifacts:
+            if is_dir:
+                try:
+                    os.makedirs(artifact)
+                except:
+                    # likely already created
+                    continue
+            else:
+                try:
+                    open(artifact, "x")
+                except:
+                    # likely already created
+                    continue
+
+    # check if all the languages we declared in project
+    # are defined in `override` (whether languages or compiler)
+    for language in config["project"]["languages"]:
+        not_in_compilers = language not in config["overrides"]["compiler"]
+        not_in_langs = len(list(filter(lambda x: x["name"] == language, config["overrides"]["languages"]))) == 0
+        not_predefined = language not in LANGUAGE_DEFAULTS
+
+
+        if not_in_compilers and not_in_langs and not_predefined:
+            errs.append(f"Unknown language ({language}) is not defined in `overrides[compiler]` or `overrides[languages]`")
+
+        if not_in_compilers and not not_in_langs and not_predefined:
+            # it's config is defined but no compiler bin path
+            errs.append(f"Language without compiler binary path provided ({language}) in `overrides[compiler]`")
+        
+    if len(errs) > 0:
+        return errs
+
+    return True
+
+
+def run_hooks(config, pool, target, kind, i, task_count, outfile=None):
+    """
+    Runs the `prebuild` or `postbuild` commands of a target
+    one after another (they may depend on each other) but
+    through the shared pool so they count against `-j`.
+
+    A failing hook stops the remaining hooks of that kind
+    but doesn't fail the target.
+
+    Returns the updated progress counter
+    """
+    label = "prebuild for shell" if target["type"] == "shell" else ("prebuild for" if kind == "prebuild" else "postbuild on")
+    for cmd in target[kind]:
+        zstatus(config, f"[{i}/{task_count}] Running {label} {target['name']}...")
+        cmd = (cmd
+            .replace("{build_dir}", config.target_dir(target["name"]))
+            .replace("{target_name}", target["name"]))
+        if outfile is not None:
+            cmd = cmd.replace("{outfile}", outfile)
+
+        proc = pool.submit(cmd, shell=True, fatal=False, span=(cmd, kind, {"target": target["name"]})).result()
+        if proc is None:
+            break
+
+        output = proc.stdout.decode() + proc.stderr.decode()
+        if config.events.enabled:
+            report(config, target, kind, cmd, proc)
+        elif output != "":
+            zprint(config, output, end="")
+
+        if proc.returncode != 0:
+            break
+
+        i += 1
+    return i
+
+
+def compile_command(config, target, compiler, flags, source):
+    obj = config.as_object(target, source)
+    return [
+        compiler,
+        "-c",
+        *flags,
+        *config.depfile_flags(target["language"], obj),
+        "-o",
+        obj,
+        source
+    ]
+
+
+def pch_command(config, target, compiler, flags, header, output):
+    compiler_config = config.get_compiler_config(target["language"])
+    return [
+        compiler,
+        *compiler_config["pch_pattern"],
+        *flags,
+        *config.depfile_flags(target["language"], output),
+        "-o",
+        output,
+        header
+    ]
+
+
+def link_command(plan, compiler):
+    """
+    The command that links (or archives) a target
+    """
+    target = plan.target
+    if target["type"] == "executable":
+        return [
+            compiler,
+            *plan.flags,
+            *plan.link_flags,
+            "-o",
+            plan.outfile,
+            *plan.objects
+        ]
+    elif target["type"] == "library":
+        if target["static"]:
+            return [
+                "ar", "rcs",
+                plan.outfile,
+                *plan.objects
+            ]
+        else:
+            return [
+                compiler,
+                *plan.flags,
+                *plan.link_flags,
+                "-shared",
+                "-o",
+                plan.outfile,
+                *plan.objects,
+            ]
+
+
+def linked_outputs(config, plan):
+    """
+    The outputs of the targets a target depends on
+    or links against, it's relinked when they change
+    """
+    names = list(plan.target["dependencies"])
+    for flag in plan.target["link_flags"] if "link_flags" in plan.target else []:
+        if isinstance(flag, dict) and flag["target"] not in names:
+            names.append(flag["target"])
+
+    build_plan = get_plan(config)
+    outputs = []
+    for name in names:
+        dep = build_plan.get(name)
+        if dep is not None and dep.outfile is not None:
+            outputs.append(dep.outfile)
+    return outputs
+
+
+def is_archive(target):
+    return target["type"] == "library" and target["static"]
+
+
+def link_inputs(config, plan):
+    """
+    The digests of everything the link of a target reads,
+    an archive only holds its objects so that's all it reads
+    """
+    paths = list(plan.objects)
+    if not is_archive(plan.target):
+        paths.extend(linked_outputs(config, plan))
+    return config.input_digests(paths)
+
+
+def link_steps(config, plan, link, inputs):
+    """
+    The commands bringing the output of a target up to date.
+
+    Archives from a previous build are updated in place, only
+    members whose object changed are replaced and the ones
+    that are gone deleted, instead of writing it all again
+    """
+    if not is_archive(plan.target):
+        return [link]
+
+    outfile = plan.outfile
+    previous = config.links.get(outfile)
+
+    if previous is None or not config.exists(outfile):
+        if config.exists(outfile):
+            # `ar` would keep members that are gone
+            os.remove(outfile)
+        return [link]
+
+    # members are named after the object's file name,
+    # which is unique within a target (see `as_object`)
+    removed = [os.path.basename(obj) for obj in previous if obj not in inputs]
+    changed = [obj for obj in plan.objects if previous.get(obj) != inputs.get(obj)]
+    steps = []
+    if len(removed) > 0:
+        steps.append(["ar", "ds", outfile, *removed])
+    if len(changed) > 0:
+        steps.append(["ar", "rs", outfile, *changed])
+    return steps
+
+
+def compile_object(config, target, compiler, flags, source):
+    """
+    Compiles a single source into its object, going
+    through the object cache first when it's enabled
+    and then to remote workers if there are any
+    """
+    obj = config.as_object(target, source)
+    depflags = config.depfile_flags(target["language"], obj)
+    args = compile_command(config, target, compiler, flags, source)
+
+    if os.path.exists(obj):
+        # the old object might be hard linked into the cache
+        # or another target, the compiler must not write through it
+        os.remove(obj)
+
+    cache = config.object_cache
+    compiler_config = config.get_compiler_config(target["language"])
+    remote = config.workers
+    if "preprocessed_pattern" not in compiler_config or "precompiled_header" in target:
+        # workers only get the preprocessed source, a precompiled
+        # header can't be used (or shipped) from there
+        remote = None
+    if (cache is None and remote is None) or "preprocess_flag" not in compiler_config:
+        return run_command(args)
+
+    # the depfile is written while preprocessing too, so a
+    # cache hit or remote compile still knows which headers it used
+    pre = run_command([compiler, compiler_config["preprocess_flag"], *flags, *depflags, source])
+    if pre.returncode != 0:
+        # let the compiler report the error
+        return run_command(args)
+
+    if cache is not None:
+        key = cache.key(compiler, flags, pre.stdout)
+        if cache.fetch(key, obj):
+            config.events.emit("cache_hit", target=target["name"], file=source, bytes=os.path.getsize(obj))
+            return subprocess.CompletedProcess(args, 0, b"", b"")
+
+    proc = None
+    if remote is not None:
+        proc = remote.compile(compiler, compiler_config["preprocessed_pattern"], flags, pre.stdout, obj, args)
+        if proc is not None and proc.returncode != 0:
+            # errors are reported by the local compiler, the
+            # worker's environment might be what's different
+            proc = None
+    if proc is None:
+        proc = run_command(args)
+
+    if proc.returncode == 0 and cache is not None:
+        cache.store(key, obj)
+    return proc
+
+
+class SharedCompiles:
+    """
+    The compiles of one build, a source compiled with the
+    same compiler and flags by several targets only runs
+    once and the other targets link to its object
+    """
+
+    def __init__(self):
+        # (language, compiler, flags, source) -> (job, object)
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def claim(self, key, obj, submit):
+        """
+        The job compiling key and the object it writes,
+        `submit` queues it if no target has yet
+        """
+        with self.lock:
+            if key not in self.jobs:
+                self.jobs[key] = (submit(), obj)
+            return self.jobs[key]
+
+
+def share_object(config, primary, obj):
+    """
+    Puts the object another target compiled at obj, hard
+    linked when possible, along with a copy of its depfile
+    """
+    if os.path.exists(obj):
+        os.remove(obj)
+    try:
+        os.link(primary, obj)
+    except OSError:
+        shutil.copyfile(primary, obj)
+
+    depfile = config.as_depfile(primary)
+    if os.path.exists(depfile):
+        shutil.copyfile(depfile, config.as_depfile(obj))
+
+
+def write_generated(path, source):
+    """
+    (Re)writes a file zen generates (unity units and
+    precompiled header wrappers), it's left untouched
+    (and so isn't rebuilt) unless its contents changed
+    """
+    try:
+        with open(path, "r") as f:
+            if f.read() == source:
+                return
+    except OSError:
+        pass
+
+    with open(path, "w") as f:
+        f.write(source)
+
+
+def build_target(config, pool, plan, shared=None):
+    """
+    Builds a single target from its plan, everything
+    it runs goes through the pool. Compiles are shared
+    with other targets through `shared` if it's given.
+
+    Returns False if the target failed to build
+    """
+    target = plan.target
+    if target["type"] == "shell":
+        # Shell targets only run prebuild commands
+        run_hooks(config, pool, target, "prebuild", 0, len(target["prebuild"]))
+        return True
+
+    sources = plan.sources
+    flags = plan.compile_flags
+
+    # lets get building!
+    # print(sources)
+    # print(plan.watching)
+    # print(flags)
+
+    compiler = config.find_compiler(target["language"])
+    # print(compiler)
+
+    # an object is rebuilt when its source or any header
+    # the compiler saw it include (see `Config.objchanged`)
+    # changed or when its compile command did, `watching`
+    # still rebuilds it all
+    tracks_headers = "depfile_pattern" in config.get_compiler_config(target["language"])
+    units = dict(plan.units)
+    for unit, members in plan.units:
+        write_generated(unit, unit_source(unit, members))
+
+    # the precompiled header is built before any object,
+    # and every object is rebuilt whenever it is
+    pch_changed = False
+    if plan.pch is not None:
+        header, output, _ = plan.pch
+        write_generated(header, pch_source(header, target["precompiled_header"]))
+        pch = pch_command(config, target, compiler, plan.flags, header, output)
+        pch_changed = config.objchanged(header, output, tracks_headers) or config.cmdchanged(output, pch)
+
+    commands = {}
+    dirty = []
+    for dep in plan.compiled:
+        obj = config.as_object(target, dep)
+        commands[dep] = compile_command(config, target, compiler, flags, dep)
+        # print("checking objchanged on the following:", dep, obj)
+        if config.objchanged(dep, obj, tracks_headers) or config.cmdchanged(obj, commands[dep]):
+            dirty.append(dep)
+        elif not tracks_headers and any(config.depchanged(member, obj) for member in units.get(dep, ())):
+            # without a depfile the members of a unit aren't known as headers
+            dirty.append(dep)
+        elif plan.pch is not None and config.depchanged(plan.pch[1], obj):
+            dirty.append(dep)
+
+    any_dep_changed = False
+    for dep in plan.watching:
+        # print("checking depchanged (extra) on", dep)
+        if config.depchanged(dep, extra=True):
+            any_dep_changed = True
+
+    if any_dep_changed:
+        dirty = list(plan.compiled)
+        pch_changed = plan.pch is not None
+    elif pch_changed:
+        dirty = list(plan.compiled)
+
+    outfile = plan.outfile
+    link = link_command(plan, compiler)
+    hooks = [*target["prebuild"], *target["postbuild"]]
+    hooks_changed = config.cmdchanged(f"{target['name']}:hooks", hooks)
+
+    # whether to relink is only settled once the objects
+    # are built, recompiled objects may come out the same
+    relink = (len(dirty) > 0 or config.cmdchanged(outfile, link) or not config.exists(outfile)
+        or config.inputschanged(outfile, link_inputs(config, plan)))
+    sources_empty = not len(sources)> 0
+    if sources_empty or not (relink or hooks_changed):
+        if not sources_empty:
+            zprint(config, f"[0/0] No changes in {target['name']}", raw=config.raw_mode)
+            config.events.emit("skip", target=target["name"], reason="up to date")
+        else:
+            zprint(config, f"[0/0] No sources in {target['name']}", raw=config.raw_mode)
+            config.events.emit("skip", target=target["name"], reason="no sources")
+        return True
+
+    task_count = len(target["prebuild"]) + int(pch_changed) + len(dirty) + len(target["postbuild"])
+    i = run_hooks(config, pool, target, "prebuild", 0, task_count)
+
+    if pch_changed:
+        zstatus(config, f"[{i}/{task_count}] Precompiling {target['precompiled_header']}")
+        zprint(config, " ".join(pch), raw=True)
+        proc = pool.submit(pch, span=(target["precompiled_header"], "pch", {"target": target["name"], "file": header, "output": output})).result()
+        if proc is None:
+            return False
+
+        report(config, target, "pch", header, proc)
+        if proc.returncode != 0:
+            return False
+        config.record_object(header, output, tracks_headers)
+        config.record_command(output, pch)
+        i += 1
+
+    # queue every dirty source on the pool, the link
+    # step below only runs once every object is done
+    compiles = {}
+    for source in dirty:
+        obj = config.as_object(target, source)
+        span = (source, "compile", {"target": target["name"], "file": source, "output": obj})
+        submit = lambda: pool.call(compile_object, config, target, compiler, flags, source, span=span)
+        if shared is None:
+            job, primary = submit(), obj
+        else:
+            job, primary = shared.claim((target["language"], compiler, tuple(flags), source), obj, submit)
+
+        if primary == obj:
+            zprint(config, " ".join(commands[source]), raw=True)
+        compiles[job] = (source, primary)
+
+    target_failed = False
+    for job in as_completed(compiles):
+        proc = job.result()
+        if proc is None:
+            # skipped, another job already failed
+            target_failed = True
+            continue
+
+        source, primary = compiles[job]
+        obj = config.as_object(target, source)
+        zstatus(config, f"[{i}/{task_count}] Building {source}")
+
+        if primary == obj:
+            # the target that compiled it reports it
+            report(config, target, "compile", source, proc)
+
+        if proc.returncode != 0:
+            target_failed = True
+        else:
+            if primary != obj:
+                share_object(config, primary, obj)
+            config.record_object(source, obj, tracks_headers)
+            config.record_command(obj, commands[source])
+
+        i += 1
+
+    if target_failed:
+        return False
+
+    inputs = link_inputs(config, plan) if relink else None
+    if relink and config.exists(outfile) and not config.inputschanged(outfile, inputs) \
+            and (is_archive(target) or not config.cmdchanged(outfile, link)):
+        # everything was rebuilt exactly as it was
+        zstatus(config, f"[{i}/{task_count}] Target {target['name']} is unchanged, skipping link")
+        config.events.emit("skip", action="link", target=target["name"], file=outfile, reason="inputs unchanged")
+        relink = False
+
+    if relink:
+        zstatus(config, f"[{i}/{task_count}] Linking target {target['name']}")
+        kind = "ar" if is_archive(target) else "link"
+        for step in link_steps(config, plan, link, inputs):
+            zprint(config, " ".join(step), raw=True)
+            proc = pool.submit(step, span=(outfile, kind, {"target": target["name"], "file": outfile, "output": outfile})).result()
+            if proc is not None:
+                report(config, target, kind, outfile, proc)
+            if proc is None or proc.returncode != 0:
+                # whatever was linked is unknown now, start over next time
+                config.links.pop(outfile, None)
+                return False
+        config.record_command(outfile, link)
+        config.record_inputs(outfile, inputs)
+
+    run_hooks(config, pool, target, "postbuild", i, task_count, outfile)
+    config.record_command(f"{target['name']}:hooks", hooks)
+    return True
+
+
+def record_manifest(config, targets):
+    """
+    Writes the manifest of a build that just succeeded, the
+    next `zen` stops right away if none of its files changed
+    (see `check_manifest`). There's none when something has
+    to run on every build anyway.
+    """
+    terms = config.define_commands.cache_terms()
+    if terms is None or any(target["type"] == "shell" and len(target["prebuild"]) > 0 for target in targets):
+        remove_manifest(config.manifest)
+        return
+
+    inputs, env, expires = terms
+    build_plan = get_plan(config)
+    inputs = [os.path.join(config.config_dir, "build.zen"), *inputs, *config.index.fresh]
+    outputs = [config.state.path]
+    skips = []
+    for target in targets:
+        if target["type"] == "shell":
+            continue
+
+        plan = build_plan.get(target["name"])
+        skips.append((target["name"], "up to date" if len(plan.sources) > 0 else "no sources"))
+        objects = [config.as_object(target, source) for source in plan.compiled]
+        inputs += [*plan.sources, *plan.watching]
+        outputs += [*objects, plan.outfile, *linked_outputs(config, plan)]
+        if plan.pch is not None:
+            header, output, _ = plan.pch
+            inputs.append(target["precompiled_header"])
+            objects.append(output)
+            outputs.append(output)
+        for obj in objects:
+            inputs.extend(config.headers(obj) or [])
+
+    save_manifest(config.manifest, config.args, inputs, outputs, env, expires, [target["name"] for target in targets], skips)
+
+
+def build(config, only=None):
+    """
+    Builds every target, or only the targets named in `only`
+    (their dependencies are expected to be built already)
+    """
+    if not isinstance(config, Config):
+        raise TypeError("config must be an instance of Config")
+
+    try:
+        build_targets(config, only)
+    finally:
+        config.tracer.save()
+
+
+def build_targets(config, only):
+    with config.tracer.span("sanity", "zen"):
+        res = config_sanity(config)
+    if res != True:
+        config.invalid(res)
+        return
+
+    with config.tracer.span("solve", "zen"):
+        passed, res = config.solve_depedency_graph()
+    if not passed:
+        config.invalid([res])
+        return
+
+    if only is not None:
+        res = [target for target in res if target["name"] in only]
+
+    # pprint.pprint(res)
+    # return
+
+    # targets start as soon as their dependencies are done,
+    # the pool is the one budget every action shares
+    jobs = config.jobs
+    if jobs is None and config.workers is not None:
+        # keep the workers busy along with the local CPUs
+        jobs = default_jobs() + config.workers.slots()
+    pool = JobPool(jobs, config.keep_going, config.tracer, config.events)
+
+    def on_skip(target):
+        zprint(config, f"[0/0] Skipping {target['name']}, a dependency failed to build")
+        config.events.emit("skip", target=target["name"], reason="dependency failed")
+
+    plan = get_plan(config)
+    shared = SharedCompiles()
+    config.events.emit("build_start", targets=[target["name"] for target in res])
+    start = time.monotonic()
+    try:
+        with config.tracer.span("build", "zen", targets=len(res)):
+            failed_targets = schedule(res, lambda target: build_target(config, pool, plan.get(target["name"]), shared), pool, on_skip)
+    except KeyboardInterrupt:
+        # keep what was already built
+        pool.shutdown()
+        config.save_state()
+        raise
+
+    pool.shutdown()
+    zprint(config, end="") # ends the status line
+    config.save_state(refresh=len(failed_targets) == 0)
+    if len(failed_targets) == 0 and only is None:
+        record_manifest(config, res)
+    else:
+        remove_manifest(config.manifest)
+
+    cache = config.object_cache
+    if cache is not None:
+        cache.evict()
+        zprint(config, f"Object cache: {cache.hits} hits, {cache.misses} misses")
+
+    config.events.emit(
+        "build_finish",
+        status="failed" if len(failed_targets) > 0 else "ok",
+        failed=sorted(failed_targets),
+        duration=round(time.monotonic() - start, 6)
+    )
+    if len(failed_targets) > 0:
+        sys.exit(1)
+
+
+def clean(config):
+    if not isinstance(config, Config):
+        raise TypeError("config must be an instance of Config")
+
+    res = config_sanity(config, skip_creation=True)
+    if res != True:
+        print("Invalid config:")
+        for err in res:
+            print(f"  {err}")
+        return
+
+    # all compiler artifacts should be stored in zen directories
+    zen, _ = artifacts(config)
+  
+    root = os.path.realpath(BUILD_ROOT)
+
+    def remove(p):
+        # nothing outside the build root is ours to delete,
+        # whatever a profile or target name resolves to
+        if os.path.commonpath([root, os.path.realpath(p)]) != root:
+            print(f"Not removing {p}, it's outside of {BUILD_ROOT}/")
+            return
+        subprocess.run([ "rm", "-rf", p ])
+
+    for artifact, is_dir in zen:
+        try:
+            if is_dir:
+                remove(artifact)
+            else:
+                os.remove(artifact)
+        except:
+            # again, likely it was already deleted
+            continue 
+
+    # the default tree holds the profiles' trees, those
+    # (and their state) are only cleaned with their -p
+    kept = set(config["profiles"]) if config.profile is None and "profiles" in config.vcfg else set()
+    try:
+        entries = os.listdir(config.build_dir)
+    except OSError:
+        entries = []
+
+    for entry in entries:
+        if entry not in kept:
+            remove(os.path.join(config.build_dir, entry))
+    if not any(entry in kept for entry in entries):
+        remove(config.build_dir)
+    if config.profile is not None:
+        try:
+            # the root too, once no tree is left in it
+            os.rmdir(os.path.dirname(config.build_dir))
+        except OSError:
+            pass
@@ -0,0 +1,69 @@
+from .config import Config
+from .builder import config_sanity, compile_command, write_generated
+from .plan import get_plan, pch_source
+import json
+import os
+
+
+def compile_commands(config):
+    """
+    The compile_commands.json entries of every source,
+    with the exact command `build` would compile it with
+    """
+    directory = os.getcwd()
+    entries = []
+    for plan in get_plan(config).targets:
+        if plan.outfile is None:
+            continue
+
+        compiler = config.find_compiler(plan.target["language"])
+        for source in plan.sources:
+            entries.append({
+                "directory": directory,
+                "arguments": compile_command(config, plan.target, compiler, plan.compile_flags, source),
+                "file": source,
+                "output": config.as_object(plan.target, source)
+            })
+    return entries
+
+
+def compdb(config, path="compile_commands.json"):
+    """
+    Writes compile_commands.json from the plan alone, no
+    compiler runs. The file is only replaced when an entry
+    changed so tools watching it (clangd) don't re-index
+    for nothing.
+
+    Returns True if the file was written
+    """
+    if not isinstance(config, Config):
+        raise TypeError("config must be an instance of Config")
+
+    res = config_sanity(config, skip_creation=True)
+    if res != True:
+        print("Invalid config:")
+        for err in res:
+            print(f"  {err}")
+        return False
+
+    # the commands `-include` the precompiled header's wrapper,
+    # tools reading them need it even before the first build
+    for plan in get_plan(config).targets:
+        if plan.outfile is not None and plan.pch is not None:
+            header = plan.pch[0]
+            os.makedirs(os.path.dirname(header), exist_ok=True)
+            write_generated(header, pch_source(header, plan.target["precompiled_header"]))
+
+    data = json.dumps(compile_commands(config), indent=2) + "\n"
+    try:
+        with open(path, "r") as f:
+            if f.read() == data:
+                return False
+    except OSError:
+        pass
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return True
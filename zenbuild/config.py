@@ -1,10 +1,30 @@
+import hashlib
 import shutil
 import os
 import sys
-import yaml
 from .provider import LANGUAGE_DEFAULTS, COMPILER_DEFAULTS
-
-from zenbuild.verifier import ZenVerifier
+from .depfile import parse_depfile
+from .hashing import Stamps
+from .state import BuildState, config_key, load_config_cache, save_config_cache
+from .discovery import SourceIndex
+from .plan import DefineCommands
+from .objcache import ObjectCache, default_cache_dir, parse_size
+from .trace import Tracer, NullTracer
+from .events import NullEvents
+from .manifest import manifest_path
+
+# every output tree (one per profile) is under it
+BUILD_ROOT = "build"
+
+
+def load_yaml(source):
+    # yaml (and the verifier with cerberus) are only imported
+    # when build.zen actually has to be parsed, most runs are
+    # served from the config cache and never need them.
+    # libyaml's loader is many times faster when it's available
+    import yaml
+    loader = yaml.CFullLoader if yaml.__with_libyaml__ else yaml.FullLoader
+    return yaml.load(source, Loader=loader)
 
 
 class Config:
@@ -12,89 +32,251 @@ class Config:
     Config options
 
     verbose - Enable verbose output (unimplemented)
-    jobs - Number of jobs to run in parallel (unimplemented)
-    build_dir - The build directory (unimplemented)
-    profile - The profile to use (unimplemented)
-    target - The target to build (unimplemented)
+    jobs - Number of jobs to run in parallel (defaults to the CPU count)
+    keep_going - Keep building unrelated targets after a failure
+    hash_mode - Decide what changed by content digests instead of mtimes
+    object_cache - The local object cache (None unless --cache is given)
+    tracer - Records spans for --trace (a `NullTracer` otherwise)
+    events - The --output=jsonl event stream (a `NullEvents` otherwise)
+    workers - The remote workers compiles are sent to (None unless --workers is given)
+    selected - The targets given with -t and everything they need (None builds every target)
+    profile - The profile overlaid on `global` (None unless -p is given)
+    build_dir - Where outputs go, build/ or build/<profile>/ with a profile
+    manifest - The manifest of the last successful build, see `check_manifest`
     """
 
     def __init__(self, args):
         # print("Loading config")
+        self.args = args
         self.verbose = args.verbose
         self.config_dir = args.config_dir
         self.raw_mode = args.raw
+        self.jobs = args.jobs
+        self.keep_going = args.keep_going
+        self.hash_mode = args.hash
+        self.tracer = Tracer(args.trace) if args.trace is not None else NullTracer()
+        self.events = NullEvents()
+        if args.output_format == "jsonl":
+            from .events import open_events
+            self.events = open_events(args.output_file)
+        self.workers = None
+        if args.workers:
+            from .remote import RemoteWorkers, parse_workers
+            self.workers = RemoteWorkers(parse_workers(args.workers))
+        self.object_cache = None
+        if args.cache:
+            self.object_cache = ObjectCache(
+                args.cache_dir if args.cache_dir is not None else default_cache_dir(),
+                parse_size(args.cache_size)
+            )
 
-        # Get the config from the directory
-        with open(os.path.join(self.config_dir, "build.zen"), "r") as f:
-            self.config = yaml.load(f, Loader=yaml.FullLoader)
+        # Get the config from the directory, the validated document
+        # is cached by the hash of build.zen so parsing and validating
+        # only happens when it changed
+        with open(os.path.join(self.config_dir, "build.zen"), "rb") as f:
+            source = f.read()
+
+        config_cache = os.path.join(self.config_dir, ".zenconfig")
+        key = config_key(source)
+        with self.tracer.span("load config cache", "zen") as span:
+            doc = load_config_cache(config_cache, key)
+            span["hit"] = doc is not None
+        self.config = doc
+        if doc is None:
+            from .verifier import ZenVerifier
+
+            with self.tracer.span("parse build.zen", "zen"):
+                self.config = load_yaml(source)
             # print(self.config)
 
-        # Validate the config
-        verifier = ZenVerifier(self.config)
-        try:
-            valid, doc = verifier.verify()
-        except Exception as e:
-            print("Validator error")
-            print(f"{e}")
-
-        if not valid:
-            # print(doc)
-            # print("classification:")
-            # print("")
-            errs = verifier.classify_errors(doc)
-            def print_errs(errs, parent=None):
-                for err in errs:
-                    # print(err)
-                    if "suberr" in err:
-                        print_errs(err["suberr"], f"{parent}[{err['field']}]" if parent is not None else err["field"])
-                    else:
-                        field = f"{parent}[{err['field']}]" if parent is not None else err["field"]
-                        print(f"Zen Config - `{field}`: {err['error']}")
-
-            print_errs(errs)
-            sys.exit(1)
-            # raise Exception()
-            #print("Invalid config:")
-            #print(f"{doc}")
+            # Validate the config
+            verifier = ZenVerifier(self.config)
+            try:
+                with self.tracer.span("validate build.zen", "zen"):
+                    valid, doc = verifier.verify()
+            except Exception as e:
+                print("Validator error")
+                print(f"{e}")
+
+            if not valid:
+                # print(doc)
+                # print("classification:")
+                # print("")
+                errs = verifier.classify_errors(doc)
+                def print_errs(errs, parent=None):
+                    for err in errs:
+                        # print(err)
+                        if "suberr" in err:
+                            print_errs(err["suberr"], f"{parent}[{err['field']}]" if parent is not None else err["field"])
+                        else:
+                            field = f"{parent}[{err['field']}]" if parent is not None else err["field"]
+                            if self.events.enabled:
+                                self.events.emit("error", message=f"`{field}`: {err['error']}")
+                            else:
+                                print(f"Zen Config - `{field}`: {err['error']}")
+
+                print_errs(errs)
+                sys.exit(1)
+                # raise Exception()
+                #print("Invalid config:")
+                #print(f"{doc}")
+
+            save_config_cache(config_cache, key, doc)
 
         self.vcfg = doc
+
+        # every profile has its own outputs and state
+        # so switching between them never rebuilds
+        self.profile = args.profile
+        self.build_dir = BUILD_ROOT
+        state_file = ".zenstate"
+        if self.profile is not None:
+            passed, res = self.apply_profile(self.profile)
+            if not passed:
+                self.invalid([res])
+                sys.exit(1)
+            self.build_dir = f"{BUILD_ROOT}/{self.profile}"
+            state_file = f".zenstate.{self.profile}"
+        self.manifest = manifest_path(self.config_dir, self.profile)
+
+        self.selected = None
+        if args.target:
+            names = [name.strip() for arg in args.target for name in arg.split(",") if name.strip() != ""]
+            passed, res = self.select_targets(names)
+            if not passed:
+                self.invalid([res])
+                sys.exit(1)
+            self.selected = res
         
-        # remove .zencache file if it exists
-        # create it again
-        self.zencache = os.path.join(self.config_dir, ".zencache")
-        with open(self.zencache, "a") as f:
-            f.close() # create it just in case
-
-        # then we can read it for the cached dep mtimes
-        # the format looks like the following:
-        # {file}:{mtime}
-        self.cached_deptimes = {}
-        with open(self.zencache, "r") as f:
-            for line in f.readlines():
-                line = line.strip()
-                if line != "":
-                    file, mtime = line.split(":")
-                    self.cached_deptimes[file] = float(mtime)
+        # the state from previous builds, see `BuildState`
+        # for what each section holds
+        with self.tracer.span("load state", "zen"):
+            self.state = BuildState(os.path.join(self.config_dir, state_file))
+        self.cached_deptimes = self.state["deptimes"]
+        self.cached_digests = self.state["digests"]
+        self.object_digests = self.state["objects"]
+        self.header_deps = self.state["headers"]
+        self.commands = self.state["commands"]
+        self.links = self.state["links"]
+        self.stamps = Stamps(self.state["stamps"])
+        # outputs are never sources, the root holds every profile's tree
+        self.index = SourceIndex(self.state["listings"], (BUILD_ROOT, self.build_dir))
+        self.define_commands = DefineCommands(self.state["defines"], self.tracer)
+
+        # resolved on first use, see `get_plan`
+        self.plan = None
+
+        # the latest mtime (or digest) of every `extra` dep
+        # we checked, it's only cached once the build succeeds
+        self.seen_deps = {}
 
     # Make it subscriptable
     def __getitem__(self, key):
         return self.vcfg[key]
 
+    def invalid(self, errs):
+        """
+        Reports why the config can't be built, as an
+        error event each with --output=jsonl
+        """
+        if self.events.enabled:
+            for err in errs:
+                self.events.emit("error", message=str(err))
+            return
+
+        print("Invalid config:")
+        for err in errs:
+            print(f"  {err}")
+
+    def apply_profile(self, name):
+        """
+        Overlays a profile on `global`, its flags go after the
+        global ones and its defines replace global defines
+        of the same symbol
+
+        returns a tuple:
+        (passed_without_error, None if passed_without_error else errorString)
+        """
+        # it names a directory under build/ and the state files
+        if name in (".", "..") or name.startswith(".") or "/" in name or os.sep in name:
+            return False, f"Invalid profile name: {name}"
+        profiles = self.vcfg["profiles"] if "profiles" in self.vcfg else {}
+        if name not in profiles:
+            return False, f"Unknown profile: {name}"
+
+        profile = profiles[name]
+        global_config = self["global"]
+        flags = [
+            *(global_config["flags"] if "flags" in global_config else []),
+            *(profile["flags"] if "flags" in profile else [])
+        ]
+        defines = profile["defines"] if "defines" in profile else []
+        symbols = {define["symbol"] for define in defines if "symbol" in define}
+        defines = [
+            *[define for define in global_config["defines"] if "symbol" not in define or define["symbol"] not in symbols],
+            *defines
+        ]
+        self.vcfg["global"] = {**global_config, "flags": flags, "defines": defines}
+        return True, None
+
+    def target_dir(self, name):
+        """
+        The directory a target's outputs go in
+        """
+        return f"{self.build_dir}/{name}/"
+
+    def select_targets(self, names):
+        """
+        names along with every target they (transitively)
+        depend on or link against
+
+        returns a tuple:
+        (passed_without_error, set of names if passed_without_error else errorString)
+        """
+        by_name = {target["name"]: target for target in self["targets"]}
+        selected = set()
+        pending = list(names)
+        while len(pending) > 0:
+            name = pending.pop()
+            if name in selected:
+                continue
+            if name not in by_name:
+                return False, f"Unknown target: {name}"
+
+            selected.add(name)
+            target = by_name[name]
+            pending.extend(target["dependencies"])
+            for flag in target["link_flags"] if "link_flags" in target else []:
+                if isinstance(flag, dict):
+                    pending.append(flag["target"])
+        return True, selected
+
+    def active_targets(self):
+        """
+        The targets this invocation works on, every
+        target unless -t narrowed it down
+        """
+        if self.selected is None:
+            return self["targets"]
+        return [target for target in self["targets"] if target["name"] in self.selected]
+
     def solve_depedency_graph(self):
         """
         returns a tuple:
         (passed_without_error, value if passed_without_error else errorString)
         """
-        targets = self["targets"]
+        targets = self.active_targets()
         graph = {}
 
         # first we need to build the graph
         for target in targets:
+            # copy the lists, solving the graph below empties them
+            # and the targets still need their dependencies afterwards
             if target['name'] in graph:
-                graph[target['name']]["dependencies"] = target["dependencies"]
+                graph[target['name']]["dependencies"] = list(target["dependencies"])
             else:
                 graph[target['name']] = {
-                    "dependencies": target['dependencies'],
+                    "dependencies": list(target['dependencies']),
                     "dependents": [],
                 }
             for dep in target['dependencies']:
@@ -235,16 +417,144 @@ class Config:
     def exists(self, path):
         return os.path.exists(path)
     
-    def cache_deptimes(self):
-        with open(self.zencache, "w") as f:
-            f.write("")
-        with open(self.zencache, "a") as f:
-            for dep in self.cached_deptimes:
-                f.write(f"{dep}:{self.cached_deptimes[dep]}\n")
+    def save_state(self, refresh=False):
+        """
+        Writes the build state in one go, refresh marks
+        every changed `extra` dep we saw as built
+        """
+        if refresh:
+            cache, other = (self.cached_digests, self.cached_deptimes) if self.hash_mode else (self.cached_deptimes, self.cached_digests)
+            cache.update(self.seen_deps)
+            # the other mode's entry is from before this build,
+            # it'd compare against a version that's gone now
+            for dep in self.seen_deps:
+                other.pop(dep, None)
+        with self.tracer.span("save state", "zen"):
+            self.state.save()
 
     def as_object(self, target, file):
         f, ext = os.path.splitext(file)
-        return f"build/{target['name']}/{f.replace('.', '_').replace(os.path.sep, '_')}_{ext.replace('.','')}.o"
+        return f"{self.target_dir(target['name'])}{f.replace('.', '_').replace(os.path.sep, '_')}_{ext.replace('.','')}.o"
+
+    def as_depfile(self, obj):
+        return f"{os.path.splitext(obj)[0]}.d"
+
+    def depfile_flags(self, lang, obj):
+        """
+        The flags asking the compiler to write the
+        headers an object includes into its depfile
+        """
+        compiler_config = self.get_compiler_config(lang)
+        if "depfile_pattern" not in compiler_config:
+            return []
+        return [flag.replace("{}", self.as_depfile(obj)) for flag in compiler_config["depfile_pattern"]]
+
+    def objchanged(self, source, obj, tracks_headers=True):
+        """
+        Whether an object has to be recompiled, that is if its
+        source or any header listed in its depfile is newer
+        (or has different contents with --hash)
+        """
+        if self.hash_mode and self.exists(obj):
+            record = self.object_digests.get(obj)
+            if record is not None and source in record:
+                for dep, digest in record.items():
+                    if not self.exists(dep) or self.stamps.digest(dep) != digest:
+                        return True
+                return False
+
+            # built before hashing was turned on, trust
+            # the mtimes this once and record the digests
+            if self.objchanged_mtime(source, obj, tracks_headers):
+                return True
+            self.record_object(source, obj, tracks_headers)
+            return False
+
+        return self.objchanged_mtime(source, obj, tracks_headers)
+
+    def record_object(self, source, obj, tracks_headers=True):
+        """
+        Remembers the headers an object was just built from
+        (and with --hash, the digests of everything it used)
+        """
+        deps = [source]
+        if tracks_headers:
+            self.header_deps.pop(obj, None)
+            headers = self.headers(obj)
+            if headers is not None:
+                deps.extend(headers)
+
+        if self.hash_mode:
+            self.object_digests[obj] = {
+                dep: self.stamps.digest(dep) for dep in deps if self.exists(dep)
+            }
+        else:
+            # the digests are of what the old object was built from
+            self.object_digests.pop(obj, None)
+
+    def headers(self, obj):
+        """
+        The header edges of an object, read from its depfile
+        the first time and kept in the build state after that
+
+        Returns None if the object has no depfile
+        """
+        if obj in self.header_deps:
+            return self.header_deps[obj]
+
+        depfile = self.as_depfile(obj)
+        if not self.exists(depfile):
+            return None
+
+        self.header_deps[obj] = parse_depfile(depfile)
+        return self.header_deps[obj]
+
+    def objchanged_mtime(self, source, obj, tracks_headers):
+        if self.depchanged(source, obj):
+            return True
+        if not tracks_headers:
+            return False
+
+        headers = self.headers(obj)
+        if headers is None:
+            # built without a depfile, we can't know its headers
+            return True
+
+        obj_mtime = os.path.getmtime(obj)
+        for header in headers:
+            if not self.exists(header) or os.path.getmtime(header) > obj_mtime:
+                return True
+        return False
+
+    def signature(self, args):
+        return hashlib.blake2b("\0".join(args).encode(), digest_size=16).hexdigest()
+
+    def cmdchanged(self, output, args):
+        """
+        Whether the command producing output isn't the
+        exact command it was last built with
+        """
+        return self.commands.get(output) != self.signature(args)
+
+    def record_command(self, output, args):
+        self.commands[output] = self.signature(args)
+
+    def input_digests(self, paths):
+        """
+        The content digest of every path that exists, objects
+        rebuilt byte for byte the same keep the same digest
+        """
+        return {path: self.stamps.digest(path) for path in paths if self.exists(path)}
+
+    def inputschanged(self, output, inputs):
+        """
+        Whether output was last linked from anything
+        other than inputs (see `input_digests`)
+        """
+        return self.links.get(output) != inputs
+
+    def record_inputs(self, output, inputs):
+        self.links[output] = inputs
 
     def depchanged(self, dep, obj=None, extra=False):
         if not extra:
@@ -256,13 +566,29 @@ class Config:
                 return False
             return os.path.getmtime(obj) < os.path.getmtime(dep)
         else:
+            if self.hash_mode:
+                current = self.stamps.digest(dep)
+                if dep in self.cached_digests:
+                    self.seen_deps[dep] = current
+                    return self.cached_digests[dep] != current
+                if dep in self.cached_deptimes:
+                    # last built without --hash, the mtime decides this once
+                    self.seen_deps[dep] = current
+                    return self.cached_deptimes[dep] < os.path.getmtime(dep)
+                self.cached_digests[dep] = current
+                return False
+
             if dep in self.cached_deptimes:
                 # print(f"from cache: {self.cached_deptimes[dep] < os.path.getmtime(dep)}")
                 # print(f"cached: {self.cached_deptimes[dep]}")
                 # print(f"current: {os.path.getmtime(dep)}")
-                return self.cached_deptimes[dep] < os.path.getmtime(dep)
+                self.seen_deps[dep] = os.path.getmtime(dep)
+                return self.cached_deptimes[dep] < self.seen_deps[dep]
+            if dep in self.cached_digests:
+                # and the other way around when built with --hash
+                self.seen_deps[dep] = os.path.getmtime(dep)
+                return self.cached_digests[dep] != self.stamps.digest(dep)
             # print(f"caching {dep} with time: {os.path.getmtime(dep)}")
             self.cached_deptimes[dep] = os.path.getmtime(dep)
-            self.cache_deptimes() # can become a HUGE disk op, any better way?
             return False
 
@@ -0,0 +1,37 @@
+def parse_depfile(path):
+    """
+    Reads a Makefile style depfile (as written by `-MMD -MF`)
+    and returns every prerequisite listed in it.
+
+    The format looks like the following:
+    build/target/file_c.o: file.c some/header.h \
+      another\ header.h
+    """
+    with open(path, "r") as f:
+        text = f.read()
+
+    deps = []
+    for rule in text.replace("\\\n", " ").splitlines():
+        _, sep, prereqs = rule.partition(": ")
+        if sep == "":
+            continue
+
+        # spaces in paths are escaped with a backslash
+        current = ""
+        escaped = False
+        for c in prereqs:
+            if escaped:
+                current += c
+                escaped = False
+            elif c == "\\":
+                escaped = True
+            elif c.isspace():
+                if current != "":
+                    deps.append(current)
+                current = ""
+            else:
+                current += c
+        if current != "":
+            deps.append(current)
+
+    return deps
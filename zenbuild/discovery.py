@@ -0,0 +1,108 @@
+import threading
+import time
+import os
+import re
+
+# directories that never hold sources, skipped wherever they are
+PRUNED_NAMES = {".git", ".hg", ".svn", "__pycache__"}
+
+# a listing whose directory changed this recently might still be
+# changing in the same mtime tick, so it isn't trusted next run
+RACY_NS = 2 * 1000 * 1000 * 1000
+
+
+class SourceIndex:
+    """
+    Serves every `{path, regex}` lookup of an invocation from
+    a single walk of each directory.
+
+    Directory listings are kept along with the directory's
+    mtime (in the build state), so a directory is only listed
+    again once an entry was added, removed or renamed in it.
+    """
+
+    def __init__(self, listings=None, build_dirs=("build",)):
+        # dir -> [mtime_ns, files, subdirs]
+        self.listings = listings if listings is not None else {}
+        # absolute, source paths can be absolute or relative
+        self.build_dirs = {os.path.abspath(build_dir) for build_dir in build_dirs}
+        self.fresh = set()
+        self.results = {}
+        self.lock = threading.RLock()
+
+    def pruned(self, path):
+        return os.path.basename(path) in PRUNED_NAMES or os.path.abspath(path) in self.build_dirs
+
+    def listing(self, path):
+        if path in self.fresh:
+            return self.listings[path]
+
+        st = os.stat(path)
+        cached = self.listings.get(path)
+        if cached is None or cached[0] != st.st_mtime_ns:
+            files = []
+            dirs = []
+            with os.scandir(path) as it:
+                for entry in it:
+                    # like os.walk, symlinked directories are
+                    # listed but never descended into
+                    if entry.is_dir(follow_symlinks=False):
+                        dirs.append(entry.name)
+                    elif not entry.is_dir():
+                        files.append(entry.name)
+
+            mtime = st.st_mtime_ns
+            if time.time_ns() - mtime < RACY_NS:
+                mtime = 0
+            cached = [mtime, files, dirs]
+            self.listings[path] = cached
+
+        self.fresh.add(path)
+        return cached
+
+    def find(self, path, regex, exclude=[]):
+        """
+        Every file under path whose name matches regex (and
+        whose path doesn't match any exclude pattern)
+        """
+        key = (path, regex, tuple(exclude))
+        with self.lock:
+            if key in self.results:
+                return self.results[key]
+
+            pattern = re.compile(regex, flags=re.M)
+            excludes = [re.compile(e) for e in exclude]
+            found = []
+            stack = [path]
+            while len(stack) > 0:
+                root = stack.pop()
+                try:
+                    _, files, dirs = self.listing(root)
+                except (FileNotFoundError, NotADirectoryError):
+                    continue
+                for file in files:
+                    if pattern.search(file):
+                        full = os.path.join(root, file)
+                        if not any(e.search(full) for e in excludes):
+                            found.append(full)
+
+                # reversed so they're walked in listing order
+                for sub in reversed(dirs):
+                    full = os.path.join(root, sub)
+                    if not self.pruned(full) and not any(e.search(full) for e in excludes):
+                        stack.append(full)
+
+            self.results[key] = found
+            return found
+
+    def invalidate(self, path=None):
+        """
+        Forgets what this invocation already saw of path
+        (or of everything), for long running processes
+        """
+        with self.lock:
+            if path is None:
+                self.fresh.clear()
+            else:
+                self.fresh.discard(path)
+            self.results.clear()
@@ -0,0 +1,66 @@
+import threading
+import time
+import sys
+
+
+class EventStream:
+    """
+    Writes one JSON object per line for --output=jsonl,
+    every line is flushed as soon as it's written so
+    whatever reads the stream sees progress live
+
+    Every event has its `event` kind and the `time` (in
+    seconds) since the stream was opened, the rest depends
+    on the kind:
+    build_start - targets
+    start - action, target, file, worker (a job began)
+    finish - action, target, file, worker, status, duration, bytes
+    cache_hit - target, file, bytes (an object came from the object cache)
+    skip - target, reason (and action when only a step was skipped)
+    diagnostic - action, target, file, status, text (anything a job printed)
+    error - message (the config is invalid)
+    build_finish - status, failed, duration
+    """
+
+    enabled = True
+
+    def __init__(self, stream):
+        import json
+
+        self.dumps = json.dumps
+        self.stream = stream
+        self.start = time.monotonic()
+        self.lock = threading.Lock()
+
+    def emit(self, event, **fields):
+        line = self.dumps({"event": event, "time": round(time.monotonic() - self.start, 6), **fields})
+        with self.lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+    def close(self):
+        if self.stream is not sys.stdout:
+            self.stream.close()
+
+
+class NullEvents:
+    """
+    Stands in for `EventStream` with the regular text output
+    """
+
+    enabled = False
+
+    def emit(self, event, **fields):
+        pass
+
+    def close(self):
+        pass
+
+
+def open_events(path=None):
+    """
+    An event stream writing to path, or stdout without one
+    """
+    if path is None or path == "-":
+        return EventStream(sys.stdout)
+    return EventStream(open(path, "w", buffering=1))
@@ -0,0 +1,42 @@
+import hashlib
+import os
+
+# files are hashed in chunks so huge generated
+# sources never have to fit in memory at once
+CHUNK_SIZE = 1 << 16
+
+
+def file_digest(path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        chunk = f.read(CHUNK_SIZE)
+        while chunk:
+            digest.update(chunk)
+            chunk = f.read(CHUNK_SIZE)
+    return digest.hexdigest()
+
+
+class Stamps:
+    """
+    The content digest of every file we've hashed along
+    with the (mtime, size, inode) it had when we hashed it.
+
+    A file is only hashed again once that stat tuple changes,
+    so a no-op check costs one stat per file.
+    """
+
+    def __init__(self, entries=None):
+        # path -> [mtime_ns, size, inode, digest]
+        self.entries = entries if entries is not None else {}
+
+    def digest(self, path):
+        st = os.stat(path)
+        key = [st.st_mtime_ns, st.st_size, st.st_ino]
+
+        cached = self.entries.get(path)
+        if cached is not None and cached[:3] == key:
+            return cached[3]
+
+        digest = file_digest(path)
+        self.entries[path] = [*key, digest]
+        return digest
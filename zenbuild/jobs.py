@@ -0,0 +1,187 @@
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from .trace import NullTracer
+from .events import NullEvents
+import subprocess
+import threading
+import time
+import os
+
+
+def default_jobs():
+    return os.cpu_count() or 1
+
+
+def run_command(args, shell=False):
+    return subprocess.run(
+        args,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        shell=shell
+    )
+
+
+class JobPool:
+    """
+    A bounded pool of workers for build actions
+
+    Every job is a subprocess whose stdout and stderr are
+    captured separately so parallel jobs never interleave
+    their output. Once a job fails, jobs that haven't started
+    yet are skipped (their result is None) unless keep_going is set.
+
+    Compiles, links and prebuild/postbuild commands of every
+    target all go through the same pool, so `jobs` is the
+    budget for the whole build.
+
+    Jobs given a `span` (the name, category and args of a
+    trace span) are recorded by the tracer on the lane of
+    the worker that ran them, along with their exit status,
+    and reported as start and finish events.
+    """
+
+    def __init__(self, jobs=None, keep_going=False, tracer=None, events=None):
+        self.jobs = jobs if jobs is not None and jobs > 0 else default_jobs()
+        self.keep_going = keep_going
+        self.tracer = tracer if tracer is not None else NullTracer()
+        self.events = events if events is not None else NullEvents()
+        self.workers = {}
+        self.lock = threading.Lock()
+        self.failed = threading.Event()
+        self.cancelled = threading.Event()
+        self.executor = ThreadPoolExecutor(max_workers=self.jobs)
+
+    def _call(self, fn, args, fatal, span):
+        if self.cancelled.is_set():
+            return None
+        if self.failed.is_set() and not self.keep_going:
+            return None
+
+        if span is None:
+            proc = self._run(fn, args)
+        else:
+            name, cat, info = span
+            worker = self.worker()
+            self.events.emit("start", action=cat, worker=worker, **info)
+            start = time.monotonic()
+            with self.tracer.span(name, cat, **info) as info:
+                proc = self._run(fn, args)
+                info["status"] = proc.returncode
+
+            output = info.get("output")
+            self.events.emit(
+                "finish",
+                action=cat,
+                worker=worker,
+                **info,
+                duration=round(time.monotonic() - start, 6),
+                bytes=os.path.getsize(output) if output is not None and os.path.exists(output) else 0
+            )
+        if proc.returncode != 0 and fatal:
+            self.failed.set()
+        return proc
+
+    def _run(self, fn, args):
+        # a job that raises fails like a command would
+        # instead of taking the whole schedule down
+        try:
+            return fn(*args)
+        except Exception as e:
+            return subprocess.CompletedProcess(args, 1, b"", f"zen: {e}\n".encode())
+
+    def worker(self):
+        """
+        The number of the worker running the current job
+        """
+        ident = threading.get_ident()
+        with self.lock:
+            if ident not in self.workers:
+                self.workers[ident] = len(self.workers)
+            return self.workers[ident]
+
+    def submit(self, args, shell=False, fatal=True, span=None):
+        """
+        Queue a command, returns a future that resolves
+        to the `CompletedProcess` (or None if it was skipped)
+
+        Non-fatal commands can fail without stopping the build
+        """
+        return self.call(run_command, args, shell, fatal=fatal, span=span)
+
+    def call(self, fn, *args, fatal=True, span=None):
+        """
+        Same as `submit` but for a function that runs the
+        job itself and returns a `CompletedProcess`
+        """
+        return self.executor.submit(self._call, fn, args, fatal, span)
+
+    def cancel(self):
+        """
+        Skips every job that hasn't started yet
+        """
+        self.cancelled.set()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+def schedule(targets, run, pool, on_skip=None):
+    """
+    Runs `run(target)` for each target as soon as all of
+    its `dependencies` are finished, so independent targets
+    build side by side. Dependencies that aren't in targets
+    are taken as already finished.
+
+    `targets` is expected in dependency order (as returned
+    by `Config.solve_depedency_graph`) and `run` returns False
+    if the target failed. Targets depending on a failed one
+    are skipped and passed to `on_skip`.
+
+    Returns the names of every failed or skipped target
+    """
+    waiting = list(targets)
+    # dependencies that aren't scheduled count as done
+    names = {target["name"] for target in waiting}
+    done = {dep for target in waiting for dep in target["dependencies"] if dep not in names}
+    failed = set()
+    running = {}
+
+    # target threads only wait on the pool, they never
+    # take a job slot, so they don't share its workers
+    with ThreadPoolExecutor(max_workers=max(len(waiting), 1)) as executor:
+        try:
+            while len(waiting) > 0 or len(running) > 0:
+                if pool.failed.is_set() and not pool.keep_going:
+                    # fail fast, don't start anything new
+                    for target in waiting:
+                        failed.add(target["name"])
+                        if on_skip is not None:
+                            on_skip(target)
+                    waiting = []
+
+                for target in list(waiting):
+                    deps = target["dependencies"]
+                    if any(dep in failed for dep in deps):
+                        waiting.remove(target)
+                        failed.add(target["name"])
+                        if on_skip is not None:
+                            on_skip(target)
+                    elif all(dep in done for dep in deps):
+                        waiting.remove(target)
+                        running[executor.submit(run, target)] = target
+
+                if len(running) == 0:
+                    break
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    target = running.pop(future)
+                    if future.result():
+                        done.add(target["name"])
+                    else:
+                        failed.add(target["name"])
+        except KeyboardInterrupt:
+            # let the running jobs wind down, skip the rest
+            pool.cancel()
+            raise
+
+    return failed
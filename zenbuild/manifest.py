@@ -0,0 +1,142 @@
+from .state import SCHEMA_FILES, state_header
+from .discovery import RACY_NS
+from .version import __version__
+import hashlib
+import marshal
+import time
+import os
+
+# what else decides which compiler and files a build uses
+ENV = ("CC", "CXX", "PATH")
+
+
+def manifest_path(config_dir, profile=None):
+    name = ".zenmanifest" if profile is None else f".zenmanifest.{profile}"
+    return os.path.join(config_dir, name)
+
+
+def manifest_key(args, env=()):
+    """
+    Everything besides the files that decides what a build
+    does: the targets picked with -t, the profile, the
+    environment and the version of zen
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(__version__.encode())
+    digest.update(os.getcwd().encode())
+    for name in SCHEMA_FILES:
+        try:
+            st = os.stat(os.path.join(os.path.dirname(__file__), name))
+            digest.update(f"{name}:{st.st_mtime_ns}:{st.st_size}".encode())
+        except OSError:
+            pass
+
+    names = sorted(name.strip() for arg in args.target or [] for name in arg.split(",") if name.strip() != "")
+    digest.update(f"\0profile={args.profile}\0targets={','.join(names)}".encode())
+    for name in (*ENV, *env):
+        digest.update(f"\0{name}={os.environ.get(name, '')}".encode())
+    return digest.digest()
+
+
+def stat_signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def save_manifest(path, args, inputs, outputs, env=(), expires=None, targets=(), skips=()):
+    """
+    Records the stat of every input and output of a build
+    that just succeeded, `check_manifest` compares them on the
+    next run. An input that changed too recently to be trusted
+    is recorded as changed, the next build rewrites it (outputs
+    were written by the build itself so they're always trusted).
+
+    targets are the names of every target built and skips
+    the (name, reason) of those that report being up to date
+    """
+    now = time.time_ns()
+    outputs = set(outputs)
+    paths = sorted(set(inputs) | outputs)
+    stats = []
+    for file in paths:
+        signature = stat_signature(file)
+        if signature is not None and file not in outputs and now - signature[0] < RACY_NS:
+            signature = (0, -1, -1)
+        stats.append(signature)
+
+    doc = {
+        "key": manifest_key(args, env),
+        "env": list(env),
+        "expires": expires,
+        "paths": paths,
+        "stats": stats,
+        "targets": list(targets),
+        "skips": [list(skip) for skip in skips],
+    }
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(state_header())
+        marshal.dump(doc, f)
+    os.replace(tmp, path)
+
+
+def remove_manifest(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def load_manifest(path):
+    try:
+        with open(path, "rb") as f:
+            header = state_header()
+            if f.read(len(header)) != header:
+                return None
+            return marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+
+
+def check_manifest(args):
+    """
+    The manifest of the last build if nothing it recorded
+    changed since, found with a single pass of stats and
+    without reading build.zen. None means the full build
+    has to run to find out what's dirty.
+    """
+    doc = load_manifest(manifest_path(args.config_dir, args.profile))
+    if doc is None:
+        return None
+    if doc["expires"] is not None and time.time() >= doc["expires"]:
+        return None
+    if doc["key"] != manifest_key(args, doc["env"]):
+        return None
+
+    for file, signature in zip(doc["paths"], doc["stats"]):
+        if stat_signature(file) != signature:
+            return None
+    return doc
+
+
+def report_up_to_date(args, doc):
+    """
+    What a build with nothing to do prints, the same as the
+    full build would (or its events with --output=jsonl)
+    """
+    if args.output_format == "jsonl":
+        from .events import open_events
+
+        events = open_events(args.output_file)
+        events.emit("build_start", targets=doc["targets"])
+        for name, reason in doc["skips"]:
+            events.emit("skip", target=name, reason=reason)
+        events.emit("build_finish", status="ok", failed=[], duration=0)
+        events.close()
+        return
+
+    for name, reason in doc["skips"]:
+        print(f"[0/0] {'No changes' if reason == 'up to date' else 'No sources'} in {name}", flush=True)
@@ -0,0 +1,169 @@
+import threading
+import hashlib
+import shutil
+import os
+
+SIZE_SUFFIXES = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+
+
+def parse_size(size):
+    """
+    Turns sizes like `512M` or `5G` into bytes
+    """
+    size = str(size).strip().upper()
+    if size[-1:] in SIZE_SUFFIXES:
+        return int(float(size[:-1]) * SIZE_SUFFIXES[size[-1]])
+    return int(size)
+
+
+def default_cache_dir():
+    if "ZEN_CACHE_DIR" in os.environ:
+        return os.environ["ZEN_CACHE_DIR"]
+    cache_home = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(cache_home, "zen")
+
+
+class ObjectCache:
+    """
+    A local, content addressed cache of compiled objects
+
+    Objects are keyed by the compiler's identity, the flattened
+    compile flags and the preprocessed source so switching
+    branches back and forth doesn't pay for the same compile twice.
+
+    The mtime of an entry is bumped every time it's used so the
+    least recently used entries are evicted first once the cache
+    grows past max_size.
+    """
+
+    def __init__(self, path, max_size):
+        self.path = path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.added = 0
+        self.compilers = {}
+        self.lock = threading.Lock()
+
+    def compiler_id(self, compiler):
+        # a compiler is the same compiler as long as its
+        # binary is, like ccache's `compiler_check = mtime`
+        if compiler not in self.compilers:
+            real = os.path.realpath(compiler)
+            st = os.stat(real)
+            self.compilers[compiler] = f"{real}:{st.st_size}:{st.st_mtime_ns}"
+        return self.compilers[compiler]
+
+    def key(self, compiler, flags, preprocessed):
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(self.compiler_id(compiler).encode())
+        digest.update(b"\0")
+        digest.update("\0".join(flags).encode())
+        digest.update(b"\0")
+        digest.update(preprocessed)
+        return digest.hexdigest()
+
+    def entry(self, key):
+        return os.path.join(self.path, key[:2], f"{key}.o")
+
+    def fetch(self, key, obj):
+        """
+        Puts the cached object for key at obj (hard linked if
+        possible, copied otherwise), returns False on a miss
+
+        A cache that can't be read is a miss too
+        """
+        entry = self.entry(key)
+        try:
+            if not os.path.exists(entry):
+                raise FileNotFoundError(entry)
+
+            if os.path.exists(obj):
+                os.remove(obj)
+            try:
+                os.link(entry, obj)
+            except OSError:
+                shutil.copyfile(entry, obj)
+            # marks the entry as recently used and makes
+            # the object newer than its sources
+            os.utime(obj)
+            os.utime(entry)
+        except OSError:
+            # the compiler must not write through a link into the cache
+            if os.path.exists(obj):
+                os.remove(obj)
+            with self.lock:
+                self.misses += 1
+            return False
+
+        with self.lock:
+            self.hits += 1
+        return True
+
+    def store(self, key, obj):
+        """
+        Adds obj to the cache, it's skipped if the
+        cache can't be written
+        """
+        entry = self.entry(key)
+        # copy then rename so a concurrent build never sees half an object
+        tmp = f"{entry}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(entry), exist_ok=True)
+            shutil.copyfile(obj, tmp)
+            os.replace(tmp, entry)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return
+
+        with self.lock:
+            self.added += os.path.getsize(entry)
+
+    def size_file(self):
+        return os.path.join(self.path, "size")
+
+    def evict(self):
+        """
+        Drops the least recently used entries until the cache
+        is back under 90% of max_size
+
+        The total size is kept in a `size` file so the cache
+        only has to be walked when it might be over the limit
+        """
+        size = 0
+        try:
+            with open(self.size_file(), "r") as f:
+                size = int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            pass
+        size += self.added
+
+        if size > self.max_size:
+            entries = []
+            size = 0
+            for root, _, files in os.walk(self.path):
+                for file in files:
+                    if not file.endswith(".o"):
+                        continue
+                    st = os.stat(os.path.join(root, file))
+                    entries.append((st.st_mtime, st.st_size, os.path.join(root, file)))
+                    size += st.st_size
+
+            entries.sort()
+            for _, entry_size, entry in entries:
+                if size <= self.max_size * 0.9:
+                    break
+                try:
+                    os.remove(entry)
+                except OSError:
+                    continue
+                size -= entry_size
+
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            with open(self.size_file(), "w") as f:
+                f.write(str(size))
+        except OSError:
+            return
+        self.added = 0
@@ -0,0 +1,469 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import namedtuple
+from types import MappingProxyType
+from .trace import NullTracer
+import subprocess
+import threading
+import time
+import os
+
+def libext():
+    # TODO: include support for Windows devices
+    if os.uname().sysname == "Darwin":
+        return ".dylib"
+    else:
+        return ".so"
+
+def flatten_files(config, sect):
+    """
+    sect is the `sources` or `watching`
+    section in config
+    """
+    files = []
+    for file in sect:
+        if isinstance(file, str):
+            files.append(file)
+        elif isinstance(file, dict):
+            exclude = file["exclude"] if "exclude" in file else []
+            files.extend(config.index.find(file["path"], file["regex"], exclude))
+    return files
+
+
+def flatten_compile_flags(flags, config, global_flags, target_name):
+    did_inherit = False if global_flags is not None else True
+    out = []
+    for flag in flags:
+        if flag == "inherit":
+            if did_inherit:
+                return False, f"Already inherited flags in target: {target_name}"
+            did_inherit = True
+            passed, res = flatten_compile_flags(global_flags, config, None, target_name)
+            if passed:
+                out.extend(res)
+            else:
+                return False, res
+        elif isinstance(flag, dict):
+            if flag["kind"] == "include_dir":
+                out.append(config["include_pattern"].replace("{}", flag["value"]))
+        else:
+            out.append(flag)
+    return True, out
+
+
+class DefineCommands:
+    """
+    Runs the `command` defines of an invocation
+
+    Each distinct command only runs once no matter how many
+    targets use it, `prefetch` runs all of them concurrently
+    up front. Defines with a `cache` key are also kept across
+    runs (in the build state) until their ttl runs out or one
+    of their `inputs` files or `env` variables changes.
+    """
+
+    def __init__(self, cache=None, tracer=None):
+        # command -> [key, time, returncode, stdout, stderr]
+        self.cache = cache if cache is not None else {}
+        self.tracer = tracer if tracer is not None else NullTracer()
+        self.results = {}
+        self.defines = {}
+        self.lock = threading.Lock()
+
+    def cache_key(self, define):
+        # defaults aren't filled in inside `oneof` schemas
+        spec = define["cache"]
+        parts = [define["command"]]
+        for name in spec["env"] if "env" in spec else []:
+            parts.append(f"{name}={os.environ.get(name, '')}")
+        for path in spec["inputs"] if "inputs" in spec else []:
+            try:
+                st = os.stat(path)
+                parts.append(f"{path}:{st.st_mtime_ns}:{st.st_size}")
+            except OSError:
+                parts.append(f"{path}:missing")
+        return "\0".join(parts)
+
+    def cached(self, define):
+        if "cache" not in define or define["command"] not in self.cache:
+            return None
+
+        key, ran_at, returncode, stdout, stderr = self.cache[define["command"]]
+        ttl = define["cache"]["ttl"] if "ttl" in define["cache"] else None
+        if key != self.cache_key(define):
+            return None
+        if ttl is not None and time.time() - ran_at > ttl:
+            return None
+        return subprocess.CompletedProcess(define["command"], returncode, stdout, stderr)
+
+    def run(self, define):
+        command = define["command"]
+        with self.lock:
+            if command in self.results:
+                return self.results[command]
+            self.defines[command] = define
+
+        res = self.cached(define)
+        if res is None:
+            with self.tracer.span(command, "define", symbol=define["symbol"]) as span:
+                res = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
+                span["status"] = res.returncode
+            if "cache" in define:
+                with self.lock:
+                    self.cache[command] = [self.cache_key(define), time.time(), res.returncode, res.stdout, res.stderr]
+
+        with self.lock:
+            self.results[command] = res
+        return res
+
+    def cache_terms(self):
+        """
+        What the results of this invocation's commands last
+        for: their `inputs` files, `env` variables and when
+        the first ttl runs out (or None without a ttl)
+
+        Returns None if a command without a `cache` key ran,
+        it has to run again on every build
+        """
+        inputs, env, expires = [], [], None
+        with self.lock:
+            for command, define in self.defines.items():
+                if "cache" not in define:
+                    return None
+                spec = define["cache"]
+                inputs.extend(spec["inputs"] if "inputs" in spec else [])
+                env.extend(spec["env"] if "env" in spec else [])
+                if "ttl" in spec and command in self.cache:
+                    ends = self.cache[command][1] + spec["ttl"]
+                    expires = ends if expires is None else min(expires, ends)
+        return inputs, env, expires
+
+    def prefetch(self, defines, jobs=None):
+        pending = {}
+        for define in defines:
+            if define["command"] not in self.results:
+                pending[define["command"]] = define
+        if len(pending) == 0:
+            return
+
+        # these mostly wait on other programs, so unless -j says
+        # otherwise they all run at once instead of per CPU
+        with ThreadPoolExecutor(max_workers=jobs if jobs else len(pending)) as executor:
+            list(executor.map(self.run, pending.values()))
+
+
+def define_commands(config, targets):
+    """
+    Every `command` define used by targets (including
+    inherited global ones)
+    """
+    global_defs = config["global"]["defines"] if "defines" in config["global"] else []
+    commands = []
+    for target in targets:
+        for define in target["defines"] if "defines" in target else []:
+            if "inherit" in define:
+                commands.extend(d for d in global_defs if "command" in d)
+            elif "command" in define:
+                commands.append(define)
+    return commands
+
+
+def flatten_defines(defs, config, global_defs, target_name, commands=None):
+    did_inherit = False if global_defs is not None else True
+    out = []
+    for define in defs:
+        if "inherit" in define:
+            if did_inherit:
+                return False, f"Already inherited defines in target: {target_name}"
+            did_inherit = True
+            passed, res = flatten_defines(global_defs, config, None, target_name, commands)
+            if passed:
+                out.extend(res)
+            else:
+                return False, res
+            continue
+        symbol = define["symbol"]
+        if "value" in define:
+            value = define["value"]
+            if "as_type" in define:
+                if define["as_type"] == "int":
+                    value = f"((int){value})"
+                elif define["as_type"] == "string":
+                    value = f"\"{value}\""
+                elif define["as_type"] == "bool":
+                    value = "true" if bool(value) else "false"
+            out.append(
+                config["define_pattern"]
+                    .replace("{}", symbol)
+                    .replace("{*}", value)
+            )
+        elif "command" in define:
+            if commands is not None:
+                res = commands.run(define)
+            else:
+                res = subprocess.run(define["command"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
+            ignore_fail = define["ignore_fail"] if "ignore_fail" in define else True
+            if res.returncode != 0 and not ignore_fail:
+                return False, f"Failed to run command for define rule ({symbol})"
+            value = define["default"] if "default" in define else ""
+            use_stderr = define["use_stderr"] if "use_stderr" in define else "no"
+            if use_stderr == "fail" and res.returncode != 0 or use_stderr == "yes":
+                value = res.stderr.decode()
+            else:
+                value = res.stdout.decode()
+            strip_whitespace = define["strip_whitespace"] if "strip_whitespace" in define else False
+            value = value.strip() if strip_whitespace else value
+            if "as_type" in define:
+                if define["as_type"] == "int":
+                    value = f"((int){value})"
+                elif define["as_type"] == "string":
+                    value = f"\"{value}\""
+                elif define["as_type"] == "bool":
+                    value = "true" if bool(value) else "false"
+            out.append(
+                config["define_pattern"]
+                    .replace("{}", symbol)
+                    .replace("{*}", value)
+            )
+    # print(out)
+    return True, out
+
+def flatten_flags(config, target, target_names=None):
+    """
+    sect is the flags list (compile or link, all the same)
+    throws an array of errors if any exist
+    otherwise returns tuple of two arrays (in this order):
+        an array of all flattened compile flags
+        an array of all flattened link flags
+
+    target_names is the set of every target's name,
+    pass it in when flattening more than one target
+    """
+    if target_names is None:
+        target_names = {t["name"] for t in config["targets"]}
+
+    flags = []
+    link_flags = []
+    errs = []
+    compiler_config = config.get_compiler_config(target["language"])
+    if "flags" in target:
+        gf = [] if "global" not in config.vcfg else []
+        gf = [] if "flags" not in config["global"] else config["global"]["flags"]
+
+        passed, res = flatten_compile_flags(target["flags"], compiler_config, gf, target["name"])
+        if passed:
+            flags.extend(res)
+        else:
+            errs.append(res)
+
+    if "link_flags" in target:
+        for flag in target["link_flags"]:
+            if isinstance(flag, dict):
+                if flag["target"] not in target_names:
+                    errs.append(f"Unknown target to link ({flag['target']}) to target: {target['name']}")
+                    continue
+                link_flags.extend([
+                    compiler_config["link_dir_pattern"].replace("{}", config.target_dir(flag["target"])),
+                    compiler_config["link_pattern"].replace("{}", f"{flag['target']}")
+                ])
+            else:
+                link_flags.append(flag)
+
+    if "defines" in target:
+        gd = [] if "global" not in config.vcfg else []
+        gd = [] if "defines" not in config["global"] else config["global"]["defines"]
+        passed, res = flatten_defines(target["defines"], compiler_config, gd, target["name"], config.define_commands)
+        if passed:
+            flags.extend(res)
+        else:
+            errs.append(res)
+
+    if len(errs) > 0:
+        return (False, errs)
+
+    return (True, (flags, link_flags))
+
+
+UNITY_BATCH = 16
+
+
+def unity_units(config, target, sources):
+    """
+    Splits the sources of a `unity` target into batches, each
+    one becoming a unit (<target dir>/unity_<n>.<ext>) that
+    includes its members. Sources with different extensions
+    never share a unit and excluded ones aren't merged at all.
+
+    Returns a tuple of (unit, members) pairs
+    """
+    spec = target["unity"]
+    if spec is False:
+        return ()
+    # defaults aren't filled in for multi-type rules
+    spec = spec if isinstance(spec, dict) else {}
+    batch = spec["batch"] if "batch" in spec else UNITY_BATCH
+    exclude = set(flatten_files(config, spec["exclude"])) if "exclude" in spec else set()
+
+    by_ext = {}
+    for source in sources:
+        if source not in exclude:
+            by_ext.setdefault(os.path.splitext(source)[1], []).append(source)
+
+    units = []
+    for ext, members in by_ext.items():
+        members.sort()
+        for i in range(0, len(members), batch):
+            units.append((f"{config.target_dir(target['name'])}unity_{len(units)}{ext}", tuple(members[i:i + batch])))
+    return tuple(units)
+
+
+def unit_source(unit, members):
+    lines = ["/* generated by zen for a unity build, don't edit */"]
+    for member in members:
+        lines.append(f'#include "{os.path.relpath(member, os.path.dirname(unit))}"')
+    return "\n".join(lines) + "\n"
+
+
+def precompiled_header(config, target):
+    """
+    The (header, output, include flags) of the precompiled
+    header of a target, or None if it doesn't have one (or
+    its language doesn't support them)
+
+    The header is a wrapper in the target's directory including the
+    real one, objects are compiled with `-include wrapper`
+    which the compiler swaps for the output next to it
+    """
+    if "precompiled_header" not in target:
+        return None
+    try:
+        compiler_config = config.get_compiler_config(target["language"])
+    except Exception:
+        # unknown languages are reported by `config_sanity`
+        return None
+    if "pch_pattern" not in compiler_config or "pch_include_pattern" not in compiler_config:
+        return None
+
+    ext = os.path.splitext(target["precompiled_header"])[1]
+    header = f"{config.target_dir(target['name'])}{target['name']}_pch{ext}"
+    output = header + (compiler_config["pch_extension"] if "pch_extension" in compiler_config else ".gch")
+    include = tuple(flag.replace("{}", header) for flag in compiler_config["pch_include_pattern"])
+    return (header, output, include)
+
+
+def pch_source(header, real):
+    return (
+        "/* generated by zen for a precompiled header, don't edit */\n"
+        f'#include "{os.path.relpath(real, os.path.dirname(header))}"\n'
+    )
+
+
+class TargetPlan(namedtuple("TargetPlan", [
+    "target", "sources", "watching", "objects", "flags", "link_flags", "outfile", "units", "pch"
+])):
+    """
+    A target with everything resolved from the config:
+    its sources (and `watching`), the objects they compile
+    into, the flattened flags and the output it links to
+
+    With `unity` the merged sources are compiled through
+    their units instead (see `unity_units`), and `pch` is
+    the target's precompiled header (see `precompiled_header`)
+
+    Shell targets only have `target`, everything else is empty
+    """
+
+    @property
+    def name(self):
+        return self.target["name"]
+
+    @property
+    def compile_flags(self):
+        """
+        The flags objects are compiled with, the
+        precompiled header (if any) included
+        """
+        if self.pch is None:
+            return self.flags
+        return (*self.flags, *self.pch[2])
+
+    @property
+    def compiled(self):
+        """
+        What actually gets compiled, the units
+        and every source that isn't in one
+        """
+        merged = {member for _, members in self.units for member in members}
+        return (*(unit for unit, _ in self.units), *(source for source in self.sources if source not in merged))
+
+
+class BuildPlan(namedtuple("BuildPlan", ["targets", "errors", "by_name"])):
+    """
+    Every target of the config resolved once per invocation,
+    `config_sanity`, `build` and `clean` all share it
+    """
+
+    def get(self, name):
+        return self.by_name.get(name)
+
+
+def outfile(config, target):
+    directory = config.target_dir(target["name"])
+    if target["type"] == "executable":
+        return f"{directory}{target['name']}"
+    return f"{directory}lib{target['name']}{'.a' if target['static'] else libext()}"
+
+
+def make_plan(config):
+    """
+    Resolves every target of the config (only the ones selected
+    with -t if it was given), the errors hold anything that
+    failed to flatten (e.g. unknown targets to link)
+    """
+    target_names = {target["name"] for target in config["targets"]}
+    targets = []
+    errs = []
+
+    # run every define command at once before flattening
+    active = config.active_targets()
+    buildable = [t for t in active if t["type"] != "shell" and "language" in t]
+    config.define_commands.prefetch(define_commands(config, buildable), config.jobs)
+
+    for target in active:
+        if target["type"] == "shell" or "language" not in target:
+            targets.append(TargetPlan(target, (), (), (), (), (), None, (), None))
+            continue
+
+        sources = tuple(flatten_files(config, target["sources"]))
+        watching = tuple(flatten_files(config, target["watching"]))
+        passed, res = flatten_flags(config, target, target_names)
+        if passed:
+            flags, link_flags = res
+        else:
+            errs.extend(res)
+            flags, link_flags = [], []
+
+        plan = TargetPlan(
+            target,
+            sources,
+            watching,
+            (),
+            tuple(flags),
+            tuple(link_flags),
+            outfile(config, target),
+            unity_units(config, target, sources),
+            precompiled_header(config, target)
+        )
+        targets.append(plan._replace(objects=tuple(config.as_object(target, source) for source in plan.compiled)))
+
+    by_name = MappingProxyType({target.name: target for target in targets})
+    return BuildPlan(tuple(targets), tuple(errs), by_name)
+
+
+def get_plan(config):
+    """
+    The plan of config, only made the first time
+    """
+    if config.plan is None:
+        with config.tracer.span("plan", "zen"):
+            config.plan = make_plan(config)
+    return config.plan
@@ -3,6 +3,12 @@ C_FAMILY_DEFAULTS = {
     "include_pattern": "-I{}",
     "link_pattern": "-l{}",
     "link_dir_pattern": "-L{}",
+    "depfile_pattern": ["-MMD", "-MF", "{}"],
+    "preprocess_flag": "-E",
+    # `pch_pattern` (the language of the header) and `preprocessed_pattern`
+    # (the language of preprocessed sources) are set per language
+    "pch_include_pattern": ["-include", "{}"],
+    "pch_extension": ".gch",
     "default_link_flags": [
         "-lobjc"
     ],
@@ -17,6 +23,8 @@ LANGUAGE_DEFAULTS = {
             "source": [".c"],
             "header": [".h"]
         },
+        "pch_pattern": ["-x", "c-header"],
+        "preprocessed_pattern": ["-x", "cpp-output"],
         **C_FAMILY_DEFAULTS
     },
     "CXX": {
@@ -24,10 +32,14 @@ LANGUAGE_DEFAULTS = {
             "source": [".cpp", ".cc", ".cxx"],
             "header": [".hpp", ".hh", ".hxx"],
         },
+        "pch_pattern": ["-x", "c++-header"],
+        "preprocessed_pattern": ["-x", "c++-cpp-output"],
         **C_FAMILY_DEFAULTS
     },
     "OBJC": {
         "extensions": [".m", ".h"],
+        "pch_pattern": ["-x", "objective-c-header"],
+        "preprocessed_pattern": ["-x", "objective-c-cpp-output"],
         **C_FAMILY_DEFAULTS
     },
     "OBJCXX": {
@@ -35,6 +47,8 @@ LANGUAGE_DEFAULTS = {
             "source": [".mm"],
             "header": [".hh", ".hpp"]
         },
+        "pch_pattern": ["-x", "objective-c++-header"],
+        "preprocessed_pattern": ["-x", "objective-c++-cpp-output"],
         **C_FAMILY_DEFAULTS
     }
 }
@@ -0,0 +1,262 @@
+from .jobs import default_jobs, run_command
+import socketserver
+import subprocess
+import threading
+import tempfile
+import hashlib
+import socket
+import shutil
+import struct
+import json
+import time
+import os
+
+DEFAULT_PORT = 7070
+
+# a json header and a binary blob, each prefixed by its length
+FRAME = struct.Struct(">IQ")
+
+# how long a worker that couldn't be reached is left alone
+RETRY_AFTER = 30
+
+CONNECT_TIMEOUT = 5
+COMPILE_TIMEOUT = 600
+
+
+def read_exact(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(min(size - len(data), 1 << 20))
+        if not chunk:
+            raise ConnectionError("connection closed")
+        data.extend(chunk)
+    return bytes(data)
+
+
+def send_message(sock, header, blob=b""):
+    data = json.dumps(header).encode()
+    sock.sendall(FRAME.pack(len(data), len(blob)) + data)
+    if len(blob) > 0:
+        sock.sendall(blob)
+
+
+def recv_message(sock):
+    size, blob_size = FRAME.unpack(read_exact(sock, FRAME.size))
+    header = json.loads(read_exact(sock, size))
+    return header, read_exact(sock, blob_size)
+
+
+_identities = {}
+_identities_lock = threading.Lock()
+
+
+def compiler_identity(compiler):
+    """
+    What makes two compilers interchangeable across
+    machines, their version and the target they build for
+    """
+    with _identities_lock:
+        if compiler in _identities:
+            return _identities[compiler]
+
+    digest = hashlib.blake2b(digest_size=16)
+    for flag in ("--version", "-dumpmachine"):
+        proc = run_command([compiler, flag])
+        digest.update(proc.stdout)
+    identity = digest.hexdigest()
+
+    with _identities_lock:
+        _identities[compiler] = identity
+    return identity
+
+
+class WorkerHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                header, blob = recv_message(self.request)
+            except (ConnectionError, OSError, ValueError, struct.error):
+                return
+
+            if header.get("op") == "ping":
+                send_message(self.request, {"status": "ok", "jobs": self.server.jobs})
+            elif header.get("op") == "compile":
+                with self.server.slots:
+                    res, obj = self.server.compile(header, blob)
+                send_message(self.request, res, obj)
+            else:
+                send_message(self.request, {"status": "error", "error": f"unknown op: {header.get('op')}"})
+
+
+class WorkerServer(socketserver.ThreadingTCPServer):
+    """
+    Compiles preprocessed sources sent by `RemoteWorkers`,
+    `jobs` of them at a time
+
+    Compilers are looked up on the worker's PATH by name
+    and only used when they're the same compiler the client
+    has (see `compiler_identity`)
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, jobs=None):
+        super().__init__(address, WorkerHandler)
+        self.jobs = jobs if jobs is not None and jobs > 0 else default_jobs()
+        self.slots = threading.Semaphore(self.jobs)
+
+    def compile(self, header, blob):
+        compiler = shutil.which(os.path.basename(header["compiler"]))
+        if compiler is None or compiler_identity(compiler) != header["identity"]:
+            return {"status": "unsupported"}, b""
+
+        with tempfile.TemporaryDirectory(prefix="zen-worker-") as tmp:
+            source = os.path.join(tmp, "source")
+            obj = os.path.join(tmp, "source.o")
+            with open(source, "wb") as f:
+                f.write(blob)
+
+            proc = run_command([compiler, "-c", *header["flags"], "-o", obj, *header["language"], source])
+            data = b""
+            if proc.returncode == 0:
+                with open(obj, "rb") as f:
+                    data = f.read()
+
+        return {
+            "status": "done",
+            "returncode": proc.returncode,
+            "stdout": proc.stdout.decode(errors="replace"),
+            "stderr": proc.stderr.decode(errors="replace"),
+        }, data
+
+
+def serve(host="127.0.0.1", port=DEFAULT_PORT, jobs=None):
+    """
+    Runs a worker until interrupted
+    """
+    with WorkerServer((host, port), jobs) as server:
+        print(f"Zen worker listening on {host}:{port} with {server.jobs} jobs", flush=True)
+        server.serve_forever()
+
+
+def parse_workers(spec):
+    """
+    `host:port,host` into [(host, port), ...]
+    """
+    workers = []
+    for address in spec.split(","):
+        address = address.strip()
+        if address == "":
+            continue
+        host, sep, port = address.rpartition(":")
+        workers.append((host, int(port)) if sep else (address, DEFAULT_PORT))
+    return workers
+
+
+class Worker:
+    def __init__(self, address):
+        self.address = address
+        self.idle = []
+        self.down_until = 0
+        self.unsupported = set()
+        self.lock = threading.Lock()
+
+    def connect(self):
+        with self.lock:
+            if len(self.idle) > 0:
+                return self.idle.pop()
+        sock = socket.create_connection(self.address, timeout=CONNECT_TIMEOUT)
+        sock.settimeout(COMPILE_TIMEOUT)
+        return sock
+
+    def release(self, sock):
+        with self.lock:
+            self.idle.append(sock)
+
+    def request(self, header, blob=b""):
+        sock = self.connect()
+        try:
+            send_message(sock, header, blob)
+            res = recv_message(sock)
+        except BaseException:
+            sock.close()
+            raise
+        self.release(sock)
+        return res
+
+
+class RemoteWorkers:
+    """
+    Sends compiles to `zen worker` processes over TCP
+
+    Each compile goes to the next worker in turn, a worker
+    that can't be reached is skipped for a while and one
+    that doesn't have the compiler is skipped for it. When
+    no worker is left `compile` returns None and the caller
+    compiles locally.
+    """
+
+    def __init__(self, addresses):
+        self.workers = [Worker(address) for address in addresses]
+        self.next = 0
+        self.lock = threading.Lock()
+
+    def candidates(self, identity):
+        with self.lock:
+            start = self.next
+            self.next = (self.next + 1) % max(len(self.workers), 1)
+        now = time.monotonic()
+        ordered = self.workers[start:] + self.workers[:start]
+        return [w for w in ordered if w.down_until <= now and identity not in w.unsupported]
+
+    def slots(self):
+        """
+        How many compiles the reachable workers run at once
+        """
+        total = 0
+        for worker in self.workers:
+            try:
+                header, _ = worker.request({"op": "ping"})
+                total += header["jobs"]
+            except (OSError, ValueError, KeyError, struct.error):
+                worker.down_until = time.monotonic() + RETRY_AFTER
+        return total
+
+    def compile(self, compiler, language, flags, preprocessed, obj, args):
+        """
+        Compiles a preprocessed source on a worker and writes
+        the object to obj, `language` are the flags telling the
+        compiler its input is already preprocessed.
+
+        Returns a `CompletedProcess` for args (the local command)
+        or None if no worker could compile it
+        """
+        identity = compiler_identity(compiler)
+        header = {
+            "op": "compile",
+            "compiler": compiler,
+            "identity": identity,
+            "language": list(language),
+            "flags": list(flags),
+        }
+        for worker in self.candidates(identity):
+            try:
+                res, data = worker.request(header, preprocessed)
+            except (OSError, ValueError, struct.error):
+                worker.down_until = time.monotonic() + RETRY_AFTER
+                continue
+
+            if res.get("status") == "unsupported":
+                worker.unsupported.add(identity)
+                continue
+            if res.get("status") != "done":
+                continue
+
+            if res["returncode"] == 0:
+                tmp = f"{obj}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, obj)
+            return subprocess.CompletedProcess(args, res["returncode"], res["stdout"].encode(), res["stderr"].encode())
+        return None
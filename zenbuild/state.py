@@ -0,0 +1,126 @@
+from .version import __version__
+import hashlib
+import marshal
+import sys
+import os
+
+# bump this whenever the layout of a section changes,
+# an older (or newer) state is thrown away instead of misread
+STATE_VERSION = 1
+MAGIC = b"ZENSTATE"
+
+
+def state_header():
+    """
+    What every file zen writes with marshal starts with,
+    marshal's format can change between Python versions
+    so that's part of the version too
+    """
+    return MAGIC + bytes([STATE_VERSION, sys.version_info.major, sys.version_info.minor])
+
+
+class BuildState:
+    """
+    Everything zen remembers between builds, kept in a
+    single `.zenstate` file in the config directory.
+
+    The state is loaded once into plain dicts (so every
+    lookup is O(1)) and written back in one go by `save`,
+    which writes a temporary file and renames it over
+    the old one so an interrupted write never corrupts it.
+
+    The sections are the following:
+    deptimes - the mtime of each `extra` dep (`watching` and the config)
+    digests - the digest of each `extra` dep (with --hash)
+    stamps - the stat tuple and digest of every hashed file
+    objects - the digests each object was built from (with --hash)
+    headers - the headers each object included, from its depfile
+    commands - a signature of the command that last built each output
+    listings - the directory listings of the source index
+    defines - the output of `command` defines with a `cache` key
+    links - the digest of every input of each output when it was last linked
+    """
+
+    SECTIONS = ("deptimes", "digests", "stamps", "objects", "headers", "commands", "listings", "defines", "links")
+
+    def __init__(self, path):
+        self.path = path
+        self.sections = {name: {} for name in BuildState.SECTIONS}
+        self.load()
+
+    def __getitem__(self, section):
+        return self.sections[section]
+
+    def load(self):
+        header = state_header()
+        try:
+            with open(self.path, "rb") as f:
+                if f.read(len(header)) != header:
+                    return
+                sections = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            # missing or unreadable, start from scratch
+            return
+
+        for name in BuildState.SECTIONS:
+            if name in sections:
+                self.sections[name] = sections[name]
+
+    def save(self):
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(state_header())
+            marshal.dump(self.sections, f)
+        os.replace(tmp, self.path)
+
+
+# the schema and the defaults it fills in
+SCHEMA_FILES = ("verifier.py", "provider.py")
+
+
+def config_key(source):
+    """
+    The cache key of a build.zen, changes along with
+    its contents or the version of zen reading it (and
+    the schema, so defaults added to it are picked up
+    without waiting for a new version)
+    """
+    digest = hashlib.blake2b(source, digest_size=16)
+    digest.update(__version__.encode())
+    for name in SCHEMA_FILES:
+        try:
+            st = os.stat(os.path.join(os.path.dirname(__file__), name))
+            digest.update(f"{name}:{st.st_mtime_ns}:{st.st_size}".encode())
+        except OSError:
+            pass
+    return digest.digest()
+
+
+def load_config_cache(path, key):
+    """
+    The validated config cached for key, or None
+    """
+    header = state_header() + key
+    try:
+        with open(path, "rb") as f:
+            if f.read(len(header)) != header:
+                return None
+            return marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+
+
+def save_config_cache(path, key, doc):
+    header = state_header() + key
+    try:
+        data = marshal.dumps(doc)
+    except ValueError:
+        # something YAML made (like a date) that
+        # marshal can't store, just don't cache it
+        return
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(header)
+        f.write(data)
+    os.replace(tmp, path)
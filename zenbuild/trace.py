@@ -0,0 +1,93 @@
+from contextlib import contextmanager, nullcontext
+import threading
+import time
+import os
+
+
+class Tracer:
+    """
+    Records spans in the Chrome trace event format, the
+    file opens in chrome://tracing or ui.perfetto.dev
+
+    Every thread that records a span gets its own lane,
+    the main thread is "zen" and pool workers are numbered
+    in the order they first ran something
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.pid = os.getpid()
+        self.start = time.perf_counter_ns()
+        self.events = []
+        self.lanes = {}
+        self.lock = threading.Lock()
+
+    def lane(self):
+        ident = threading.get_ident()
+        with self.lock:
+            if ident not in self.lanes:
+                tid = len(self.lanes)
+                name = "zen" if threading.current_thread() is threading.main_thread() else f"worker {tid}"
+                self.lanes[ident] = tid
+                self.events.append({
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": self.pid,
+                    "tid": tid,
+                    "args": {"name": name}
+                })
+            return self.lanes[ident]
+
+    @contextmanager
+    def span(self, name, cat, **args):
+        """
+        Records how long the block took, the yielded dict
+        is the span's args so the block can add to them
+        (e.g. the exit status once it's known)
+        """
+        tid = self.lane()
+        start = time.perf_counter_ns()
+        try:
+            yield args
+        finally:
+            end = time.perf_counter_ns()
+            with self.lock:
+                self.events.append({
+                    "name": name,
+                    "cat": cat,
+                    "ph": "X",
+                    "ts": (start - self.start) / 1000,
+                    "dur": (end - start) / 1000,
+                    "pid": self.pid,
+                    "tid": tid,
+                    "args": args
+                })
+
+    def save(self):
+        import json
+
+        with self.lock:
+            events = [{
+                "name": "process_name",
+                "ph": "M",
+                "pid": self.pid,
+                "tid": 0,
+                "args": {"name": "zen"}
+            }, *self.events]
+
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        os.replace(tmp, self.path)
+
+
+class NullTracer:
+    """
+    Stands in for `Tracer` when --trace isn't given
+    """
+
+    def span(self, name, cat, **args):
+        return nullcontext(args)
+
+    def save(self):
+        pass
@@ -1,7 +1,5 @@
 from .provider import LANGUAGE_DEFAULTS
 from cerberus import Validator
-import pprint
-import json
 
 
 class VerificationError(Exception):
@@ -31,6 +29,24 @@ LANGUAGE_SUBSCHEMA = {
                 "dir": {"type": "string"}
             }
         },
+        "depfile_pattern": {
+            "type": "list",
+            "schema": {"type": "string"}
+        },
+        "preprocess_flag": {"type": "string"},
+        "pch_pattern": {
+            "type": "list",
+            "schema": {"type": "string"}
+        },
+        "pch_include_pattern": {
+            "type": "list",
+            "schema": {"type": "string"}
+        },
+        "pch_extension": {"type": "string"},
+        "preprocessed_pattern": {
+            "type": "list",
+            "schema": {"type": "string"}
+        },
         "standard": {"type": "string"},
         "std_pattern": {"type": "string"},
         "extensions": {
@@ -78,7 +94,15 @@ DEFINE_VALUE_SUBSCHEMAS = [
         "strip_whitespace": {"type": "boolean", "default": False},
         "ignore_fail": {"type": "boolean", "default": True},
         "use_stderr": {"type": "string", "allowed": ["yes", "fail", "no"], "default": "no"},
-        "default": {"type": "string"}
+        "default": {"type": "string"},
+        "cache": {
+            "type": "dict",
+            "schema": {
+                "ttl": {"type": "number"},
+                "inputs": {"type": "list", "schema": {"type": "string"}},
+                "env": {"type": "list", "schema": {"type": "string"}}
+            }
+        }
     },
     { "inherit": {"type": "boolean", "required": True} }
 ]
@@ -121,7 +145,12 @@ SOURCE_SUBSCHEMA = {
     "type": ["string", "dict"],
     "schema": {
         "path": {"type": "string"},
-        "regex": {"type": "string"}
+        "regex": {"type": "string"},
+        "exclude": {
+            "type": "list",
+            "schema": {"type": "string"},
+            "default": []
+        }
     }
 }
 
@@ -150,6 +179,21 @@ TARGET_SUBSCHEMA = {
         },
         "type": {"type": "string", "allowed": ["library", "executable", "shell"], "default": "executable"},
         "static": {"type": "boolean", "default": False},
+        "precompiled_header": {"type": "string"},
+        # `true` or the size of each batch and the sources
+        # that can't be merged into one
+        "unity": {
+            "type": ["boolean", "dict"],
+            "schema": {
+                "batch": {"type": "integer", "min": 1, "default": 16},
+                "exclude": {
+                    "type": "list",
+                    "schema": SOURCE_SUBSCHEMA,
+                    "default": []
+                }
+            },
+            "default": False
+        },
         "defines": {
             "type": "list",
             "schema": DEFINE_SUBSCHEMA
@@ -208,6 +252,15 @@ PROJECT_SCHEMA = {
             "defines": []
         }
     },
+    # named overlays on `global`, picked with -p
+    "profiles": {
+        "type": "dict",
+        "keysrules": {"type": "string", "regex": "^[A-Za-z0-9_-][A-Za-z0-9_.-]*$"},
+        "valuesrules": {
+            "type": "dict",
+            "schema": GLOBAL_SCHEMA
+        }
+    },
     "targets": {
         "type": "list",
         "schema": TARGET_SUBSCHEMA,
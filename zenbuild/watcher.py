@@ -0,0 +1,251 @@
+from .config import Config, BUILD_ROOT
+from .builder import build, zprint
+from .plan import get_plan
+import ctypes.util
+import ctypes
+import select
+import struct
+import time
+import sys
+import os
+
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+              | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+
+# entries were added to or removed from a directory
+STRUCTURE_MASK = IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+EVENT = struct.Struct("iIII")
+
+
+class InotifyWatcher:
+    """
+    Watches directories through inotify (Linux only)
+
+    `wait` returns the (path, structural) pairs of every
+    change, structural being True when entries were
+    added to or removed from a directory
+    """
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.add_watch = libc.inotify_add_watch
+        self.fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.dirs = {}
+        self.watched = set()
+
+    def add(self, path):
+        if path in self.watched:
+            return
+        wd = self.add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd >= 0:
+            self.dirs[wd] = path
+            self.watched.add(path)
+
+    def wait(self, timeout):
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if len(ready) == 0:
+            return set()
+
+        changes = set()
+        data = os.read(self.fd, 1 << 16)
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT.unpack_from(data, offset)
+            offset += EVENT.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+
+            root = self.dirs.get(wd)
+            if root is None:
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                # it has to be watched again if it comes back
+                self.watched.discard(root)
+                changes.add((root, True))
+                continue
+
+            path = os.path.join(root, os.fsdecode(name)) if name else root
+            changes.add((path, bool(mask & STRUCTURE_MASK)))
+        return changes
+
+
+class PollingWatcher:
+    """
+    The fallback when inotify isn't available, it
+    re-lists every watched directory each interval
+    """
+
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self.snapshots = {}
+
+    def snapshot(self, path):
+        entries = {}
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        st = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    entries[entry.name] = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+        return entries
+
+    def add(self, path):
+        if path not in self.snapshots:
+            self.snapshots[path] = self.snapshot(path)
+
+    def wait(self, timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            changes = set()
+            for path, old in list(self.snapshots.items()):
+                new = self.snapshot(path)
+                if new == old:
+                    continue
+                self.snapshots[path] = new
+                if old is None or new is None:
+                    changes.add((path, True))
+                    continue
+                for name in old.keys() | new.keys():
+                    if old.get(name) != new.get(name):
+                        changes.add((os.path.join(path, name), name not in old or name not in new))
+
+            if len(changes) > 0:
+                return changes
+            if deadline is not None and time.monotonic() >= deadline:
+                return changes
+            time.sleep(self.interval if deadline is None else min(self.interval, max(deadline - time.monotonic(), 0)))
+
+
+def make_watcher(poll=False):
+    if not poll and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher()
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher()
+
+
+def watched_files(config):
+    """
+    Maps the absolute path of every file a target
+    reads (sources, `watching` and the headers its
+    objects included) to the names of those targets
+    """
+    files = {}
+    for plan in get_plan(config).targets:
+        paths = [*plan.sources, *plan.watching]
+        for obj in plan.objects:
+            paths.extend(config.header_deps.get(obj, []))
+        for path in paths:
+            files.setdefault(os.path.abspath(path), set()).add(plan.name)
+    return files
+
+
+def dependents(config, names):
+    """
+    names along with every target that (transitively) depends on them
+    """
+    names = set(names)
+    changed = True
+    while changed:
+        changed = False
+        for target in config.active_targets():
+            if target["name"] not in names and any(dep in names for dep in target["dependencies"]):
+                names.add(target["name"])
+                changed = True
+    return names
+
+
+def watch(config, debounce=0.03, poll=False):
+    """
+    Builds, then keeps rebuilding whatever a change
+    on disk affects until interrupted.
+
+    The parsed config, the source index and the build
+    state all stay in memory between builds, changes
+    are picked up through inotify (or by polling).
+    """
+    if not isinstance(config, Config):
+        raise TypeError("config must be an instance of Config")
+
+    config_file = os.path.abspath(os.path.join(config.config_dir, "build.zen"))
+    build_dir = os.path.abspath(BUILD_ROOT)
+    watcher = make_watcher(poll)
+    only = None
+
+    while True:
+        if only is None or len(only) > 0:
+            try:
+                build(config, only)
+            except SystemExit:
+                # a failed build shouldn't stop watching
+                pass
+            zprint(config, "Watching for changes...")
+
+        files = watched_files(config)
+        watcher.add(os.path.dirname(config_file))
+        for path in config.index.fresh:
+            watcher.add(os.path.abspath(path))
+        for path in files:
+            watcher.add(os.path.dirname(path))
+
+        # wait for a change, then for the burst to settle
+        changes = watcher.wait(None)
+        more = watcher.wait(debounce)
+        while len(more) > 0:
+            changes |= more
+            more = watcher.wait(debounce)
+
+        affected = set()
+        replan = False
+        reload = False
+        for path, structural in changes:
+            if path == config_file:
+                reload = True
+            elif path in files:
+                affected |= files[path]
+            elif path == build_dir or path.startswith(build_dir + os.sep) or os.path.basename(path).startswith((".zenstate", ".zenconfig", ".zenmanifest")):
+                # our own output
+                continue
+            elif structural:
+                # might be a new source for a regex entry
+                replan = True
+
+        if reload:
+            config.save_state()
+            try:
+                config = Config(config.args)
+            except SystemExit:
+                # invalid config, wait for the next edit
+                only = set()
+                continue
+            only = None
+            continue
+
+        if replan:
+            old = {plan.name: (plan.sources, plan.watching) for plan in get_plan(config).targets}
+            # only directories whose mtime changed are listed again
+            config.index.invalidate()
+            config.plan = None
+            for plan in get_plan(config).targets:
+                if old.get(plan.name) != (plan.sources, plan.watching):
+                    affected.add(plan.name)
+
+        only = dependents(config, affected)